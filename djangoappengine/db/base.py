@@ -213,6 +213,7 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
                 print 'Deleting...'
                 from django.db import models
                 from google.appengine.api import datastore as ds
+                from . import entitycache
                 for model in models.get_models():
                     print 'Deleting %s...' % model._meta.db_table
                     while True:
@@ -220,6 +221,7 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
                         if not data:
                             break
                         ds.Delete(data)
+                        entitycache.invalidate(data)
                 print "Datastore flushed! Please check your dashboard's " \
                       'datastore viewer for any remaining entities and remove ' \
                       'all unneeded indexes with manage.py vacuum_indexes.'
@@ -228,4 +230,6 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
                 exit()
         else:
             destroy_datastore(*self._get_paths())
+            from . import entitycache
+            entitycache.clear()
         self._setup_stubs()
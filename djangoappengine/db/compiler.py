@@ -1,4 +1,6 @@
+from . import entitycache
 from .db_settings import get_indexes
+from .fanout import FanOutQuery, iter_keys
 
 import datetime
 import sys
@@ -11,8 +13,7 @@ from django.utils.tree import Node
 
 from functools import wraps
 
-from google.appengine.api.datastore import Entity, Query, MultiQuery, \
-    Put, Get, Delete, Key
+from google.appengine.api.datastore import Entity, Query, Put, Delete, Key
 from google.appengine.api.datastore_errors import Error as GAEError
 from google.appengine.api.datastore_types import Text, Category, Email, Link, \
     PhoneNumber, PostalAddress, Text, Blob, ByteString, GeoPt, IM, Key, \
@@ -41,6 +42,9 @@ OPERATORS_MAP = {
     'year': None,
 }
 
+# The maximum number of entities per Put call
+MAX_PUT_BATCH_SIZE = 500
+
 NEGATION_MAP = {
     'gt': '<=',
     'gte': '<',
@@ -50,6 +54,17 @@ NEGATION_MAP = {
     #'exact': '!=', # this might actually become individual '<' and '>' queries
 }
 
+# Types of the values convert_value_from_db returns as they are, except for
+# datetimes in date and time columns
+UNCHANGED_TYPES = (type(None), bool, int, long, float, unicode,
+                   datetime.datetime, datetime.date, datetime.time)
+
+# How primary keys are read from the Key of an entity, by db_type
+KEY_ATTRIBUTES = {
+    'integer': 'id',
+    'text': 'name',
+}
+
 def safe_call(func):
     @wraps(func)
     def _func(*args, **kwargs):
@@ -76,10 +91,11 @@ class GAEQuery(NonrelQuery):
             pks_only = True
         self.db_table = self.query.get_meta().db_table
         self.pks_only = pks_only
-        start_cursor = getattr(self.query, '_gae_start_cursor', None)
-        end_cursor = getattr(self.query, '_gae_end_cursor', None)
+        self.start_cursor = getattr(self.query, '_gae_start_cursor', None)
+        self.end_cursor = getattr(self.query, '_gae_end_cursor', None)
         self.gae_query = [Query(self.db_table, keys_only=self.pks_only,
-                                cursor=start_cursor, end_cursor=end_cursor)]
+                                cursor=self.start_cursor,
+                                end_cursor=self.end_cursor)]
 
     # This is needed for debugging
     def __repr__(self):
@@ -115,28 +131,44 @@ class GAEQuery(NonrelQuery):
                 continue
             yield self._make_entity(entity)
 
-        if executed and not isinstance(query, MultiQuery):
+        if executed and not isinstance(query, FanOutQuery):
             self.query._gae_cursor = query.GetCompiledCursor()
 
     @safe_call
     def count(self, limit=None):
         if self.pk_filters is not None:
             return len(self.get_matching_pk(0, limit))
-        if self.excluded_pks:
-            return len(list(self.fetch(0, 2000)))
-        kw = {}
-        if limit is not None:
-            kw['limit'] = limit
-        return self._build_query().Count(**kw)
+
+        # Counting only needs the keys, which are fetched in batches
+        fetch_limit = limit
+        if self.excluded_pks and limit is not None:
+            fetch_limit += len(self.excluded_pks)
+        if len(self.gae_query) > 1:
+            keys = self._build_query().iter_keys(fetch_limit)
+        else:
+            keys = iter_keys(self.db_table, self.gae_query[0],
+                             self.gae_ordering, self.start_cursor,
+                             self.end_cursor, fetch_limit)
+
+        count = 0
+        for key in keys:
+            if key in self.excluded_pks:
+                continue
+            count += 1
+            if count == limit:
+                break
+        return count
 
     @safe_call
     def delete(self):
         if self.pk_filters is not None:
             keys = [key for key in self.pk_filters if key is not None]
         else:
-            keys = self.fetch()
+            keys = [entity[self.query.get_meta().pk.column]
+                    for entity in self.fetch()]
         if keys:
             Delete(keys)
+            entitycache.invalidate(keys)
 
     @safe_call
     def order_by(self, ordering):
@@ -150,6 +182,45 @@ class GAEQuery(NonrelQuery):
                 order = '__key__'
             self.gae_ordering.append((order, direction))
 
+    def add_filters(self, filters):
+        if self._negated or filters.negated or filters.connector != OR:
+            # "not (a OR b)" is handled as "(not a) AND (not b)" by the
+            # default implementation
+            return super(GAEQuery, self).add_filters(filters)
+
+        children = self._get_children(filters.children)
+        if not children:
+            return
+
+        # Every alternative gets its own copies of the sub-queries built so
+        # far, and the query runs all of them (see FanOutQuery)
+        gae_query = self.gae_query
+        combined = []
+        for child in children:
+            self.gae_query = [self._copy_query(query) for query in gae_query]
+            pk_filters, excluded_pks = self.pk_filters, self.excluded_pks
+            if isinstance(child, Node):
+                self.add_filters(child)
+            else:
+                column, lookup_type, db_type, value = self._decode_child(child)
+                self.add_filter(column, lookup_type, False, db_type, value)
+
+            if self.pk_filters == [] and pk_filters is None:
+                # An empty __in filter, this alternative matches nothing
+                self.pk_filters = None
+                continue
+            if self.pk_filters is not pk_filters or \
+                    self.excluded_pks is not excluded_pks:
+                raise DatabaseError("Filters on the primary key can't be "
+                                    "combined with OR")
+            combined.extend(self.gae_query)
+
+        if combined:
+            self.gae_query = combined
+        else:
+            self.gae_query = gae_query
+            self.pk_filters = []
+
     # This function is used by the default add_filters() implementation
     @safe_call
     def add_filter(self, column, lookup_type, negated, db_type, value):
@@ -228,9 +299,6 @@ class GAEQuery(NonrelQuery):
             self.inequality_field = column
         elif lookup_type == 'in':
             # Create sub-query combinations, one for each value
-            if len(self.gae_query) * len(value) > 30:
-                raise DatabaseError("You can't query against more than "
-                                    "30 __in filter value combinations")
             op_values = [('=', v) for v in value]
             self._combine_filters(column, db_type, op_values)
             return
@@ -286,13 +354,20 @@ class GAEQuery(NonrelQuery):
         combined = []
         for query in gae_query:
             for op, value in op_values:
-                self.gae_query = [Query(self.db_table,
-                                        keys_only=self.pks_only)]
-                self.gae_query[0].update(query)
+                self.gae_query = [self._copy_query(query)]
                 self._add_filter(column, op, db_type, value)
                 combined.append(self.gae_query[0])
         self.gae_query = combined
 
+    def _copy_query(self, query):
+        copy = Query(self.db_table, keys_only=self.pks_only)
+        for key, value in query.items():
+            # _add_filter appends to lists in place
+            if isinstance(value, list):
+                value = list(value)
+            copy[key] = value
+        return copy
+
     def _make_entity(self, entity):
         if isinstance(entity, Key):
             key = entity
@@ -306,7 +381,7 @@ class GAEQuery(NonrelQuery):
     @safe_call
     def _build_query(self):
         if len(self.gae_query) > 1:
-            return MultiQuery(self.gae_query, self.gae_ordering)
+            return FanOutQuery(self.db_table, self.gae_query, self.gae_ordering)
         query = self.gae_query[0]
         query.Order(*self.gae_ordering)
         return query
@@ -315,7 +390,7 @@ class GAEQuery(NonrelQuery):
         if not self.pk_filters:
             return []
 
-        results = [result for result in Get(self.pk_filters)
+        results = [result for result in entitycache.get(self.pk_filters)
                    if result is not None and
                        self.matches_filters(result)]
         if self.ordering:
@@ -348,6 +423,35 @@ class SQLCompiler(NonrelCompiler):
     """
     query_class = GAEQuery
 
+    def has_results(self):
+        # Only the keys are needed to know whether there are results
+        return bool(self.build_query([self.query.get_meta().pk]).count(1))
+
+    def get_value_converter(self, db_type):
+        # Collections and decimals always need convert_value_from_db
+        if db_type.startswith(('ListField:', 'SetField:', 'DictField:',
+                               'decimal')):
+            return super(SQLCompiler, self).get_value_converter(db_type)
+
+        # Values of these types come out of convert_value_from_db unchanged
+        unchanged = set(UNCHANGED_TYPES)
+        if db_type in ('date', 'time'):
+            unchanged.discard(datetime.datetime)
+        unchanged = frozenset(unchanged)
+        key_attr = KEY_ATTRIBUTES.get(db_type)
+
+        def convert(compiler, value):
+            value_type = type(value)
+            if value_type in unchanged:
+                return value
+            if value_type is Key and key_attr is not None and \
+                    value.parent() is None:
+                id_or_name = getattr(value, key_attr)()
+                if id_or_name is not None:
+                    return id_or_name
+            return compiler.convert_value_from_db(db_type, value)
+        return convert
+
     def convert_value_from_db(self, db_type, value):
         if isinstance(value, (list, tuple, set)) and \
                 db_type.startswith(('ListField:', 'SetField:')):
@@ -443,6 +547,18 @@ class SQLCompiler(NonrelCompiler):
 class SQLInsertCompiler(NonrelInsertCompiler, SQLCompiler):
     @safe_call
     def insert(self, data, return_id=False):
+        entity = self.make_entity(data)
+        batch = getattr(self.query, '_gae_put_batch', None)
+        if batch is not None:
+            # The entity is put together with the rest of the batch, see
+            # djangoappengine.db.utils.bulk_save
+            batch.append(entity)
+            return None
+        key = Put(entity)
+        entitycache.invalidate([key])
+        return key.id_or_name()
+
+    def make_entity(self, data):
         gae_data = {}
         opts = self.query.get_meta()
         indexes = get_indexes().get(self.query.model, {})
@@ -465,8 +581,19 @@ class SQLInsertCompiler(NonrelInsertCompiler, SQLCompiler):
 
         entity = Entity(self.query.get_meta().db_table, **kwds)
         entity.update(gae_data)
-        key = Put(entity)
-        return key.id_or_name()
+        return entity
+
+@safe_call
+def put_in_batches(entities, batch_size=MAX_PUT_BATCH_SIZE):
+    """Puts entities with as few datastore calls as possible.
+
+    Returns the keys of the entities, in order.
+    """
+    keys = []
+    for start in range(0, len(entities), batch_size):
+        keys.extend(Put(entities[start:start + batch_size]))
+    entitycache.invalidate(keys)
+    return keys
 
 class SQLUpdateCompiler(NonrelUpdateCompiler, SQLCompiler):
     pass
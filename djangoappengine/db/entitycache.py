@@ -0,0 +1,118 @@
+"""
+Read-through cache of the entities fetched by primary key, i.e. by
+objects.get(pk=...) and pk__in filters. Entities are looked up in a
+request-local dictionary first, then in memcache, and only the remaining
+keys are fetched from the datastore with one batch get. The request-local
+tier only exists while Django handles a request, so code running outside
+of one (e.g. deferred tasks) only uses memcache.
+
+The backend drops the cached entities of every key it writes or deletes.
+Entities written without the backend (e.g. with google.appengine.ext.db)
+can be served stale until GAE_ENTITY_CACHE_TIMEOUT expires, so the cache
+is disabled unless GAE_ENTITY_CACHE is set. Reads inside a transaction
+always go to the datastore.
+"""
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from google.appengine.api import datastore, memcache
+from google.appengine.datastore import entity_pb
+import threading
+
+KEY_PREFIX = 'gae_entity:'
+
+# For how many seconds a written key can't be cached again, so a request
+# that read the entity before the write can't put the old version back
+LOCK_SECONDS = 5
+
+try:
+    in_transaction = datastore.IsInTransaction
+except AttributeError:
+    def in_transaction():
+        return datastore._CurrentTransactionKey() is not None
+
+_local = threading.local()
+
+def _get_local():
+    """Returns the request-local tier, or None outside of requests"""
+    return getattr(_local, 'entities', None)
+
+def start_request(**kwargs):
+    _local.entities = {}
+
+def end_request(**kwargs):
+    _local.entities = None
+
+request_started.connect(start_request)
+request_finished.connect(end_request)
+
+def clear():
+    """Empties the request-local tier"""
+    if _get_local() is not None:
+        _local.entities = {}
+
+def is_enabled():
+    return getattr(settings, 'GAE_ENTITY_CACHE', False)
+
+def _cache_key(key):
+    return KEY_PREFIX + str(key)
+
+def _decode(data):
+    return datastore.Entity.FromPb(entity_pb.EntityProto(data))
+
+def get(keys):
+    """Fetches the entities of keys like datastore.Get(keys) does.
+
+    Returns a list with the entity of every key, or None where there's
+    none. The tiers hold encoded entities, so every call returns new
+    Entity objects the caller is free to change.
+    """
+    if not is_enabled() or in_transaction():
+        return datastore.Get(keys)
+
+    local = _get_local()
+    if local is None:
+        local = {}
+    found = {}
+    missing = []
+    for key in keys:
+        if key in local:
+            found[key] = _decode(local[key])
+        else:
+            missing.append(key)
+
+    if missing:
+        cached = memcache.get_multi([_cache_key(key) for key in missing])
+        keys_to_get = []
+        for key in missing:
+            data = cached.get(_cache_key(key))
+            if data is None:
+                keys_to_get.append(key)
+            else:
+                local[key] = data
+                found[key] = _decode(data)
+
+        if keys_to_get:
+            to_cache = {}
+            for key, entity in zip(keys_to_get, datastore.Get(keys_to_get)):
+                # Missing entities aren't cached, they could be created
+                # without the backend noticing
+                if entity is not None:
+                    found[key] = entity
+                    local[key] = entity.ToPb().Encode()
+                    to_cache[_cache_key(key)] = local[key]
+            if to_cache:
+                # add() rather than set(), so a locked key stays uncached
+                memcache.add_multi(to_cache, time=getattr(settings,
+                                   'GAE_ENTITY_CACHE_TIMEOUT', 600))
+
+    return [found.get(key) for key in keys]
+
+def invalidate(keys):
+    """Drops the cached entities of keys after they were written or deleted"""
+    local = _get_local()
+    if local is not None:
+        for key in keys:
+            local.pop(key, None)
+    if is_enabled():
+        memcache.delete_multi([_cache_key(key) for key in keys],
+                              seconds=LOCK_SECONDS)
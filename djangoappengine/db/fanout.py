@@ -0,0 +1,247 @@
+"""
+Execution of queries that need several datastore queries, i.e. queries with
+__in filters or ORed filters. The datastore can only AND filters, so each
+combination of values becomes its own sub-query. All the sub-queries are
+started with the datastore's asynchronous query API before any of them is
+read, so their first batches are fetched concurrently instead of one after
+the other, and the results are merged in the requested order. SDKs before
+1.5.0 have no asynchronous queries, the sub-queries then run one after the
+other. An entity matching several sub-queries is only
+returned once, and no sub-query is read further than the requested slice
+needs.
+"""
+from google.appengine.api.datastore import Key, Query
+import heapq
+
+try:
+    from google.appengine.api.datastore import _GetConnection
+    from google.appengine.datastore.datastore_query import Batcher, \
+        QueryOptions, ResultsIterator
+except ImportError:
+    _GetConnection = None
+
+INEQUALITY_OPERATORS = ('<', '<=', '>', '>=')
+
+# The number of keys fetched per datastore call when counting
+KEYS_BATCH_SIZE = 1000
+
+class Descending(object):
+    """Inverts the order of a value inside a sort key"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+def get_inequality_property(queries):
+    """
+    Returns the property of the first inequality filter of the queries.
+    The datastore sorts such queries on that property first.
+    """
+    for query in queries:
+        for key in query.keys():
+            parts = key.split()
+            if len(parts) == 2 and parts[1] in INEQUALITY_OPERATORS:
+                return parts[0]
+    return None
+
+def run_async(query, limit=None):
+    """
+    Sends the RPC for the first batch of query and returns an iterator over
+    its results without waiting for the RPC to complete. Without the
+    asynchronous query API the query is run with Run().
+    """
+    if _GetConnection is None:
+        kw = {}
+        if limit is not None:
+            kw['limit'] = limit
+        return iter(query.Run(**kw))
+    options = query.GetQueryOptions()
+    if limit is not None:
+        options = options.merge(QueryOptions(limit=limit))
+    batch = query.GetQuery().run_async(_GetConnection(), options)
+    return ResultsIterator(Batcher(options, batch))
+
+def iter_keys(kind, query, ordering=(), cursor=None, end_cursor=None,
+              limit=None, batch_size=KEYS_BATCH_SIZE):
+    """
+    Yields up to limit keys matching the filters of query. The keys are
+    fetched batch_size at a time with keys-only queries, each one starting
+    at the cursor of the previous one, so there's no cap on the number of
+    keys and no entity is ever loaded.
+    """
+    while limit is None or limit > 0:
+        size = batch_size
+        if limit is not None:
+            size = min(size, limit)
+            limit -= size
+        page = Query(kind, keys_only=True, cursor=cursor, end_cursor=end_cursor)
+        page.update(query)
+        page.Order(*ordering)
+        keys = page.Get(size)
+        for key in keys:
+            yield key
+        if len(keys) < size:
+            return
+        cursor = page.GetCompiledCursor()
+
+class FanOutQuery(object):
+    """
+    Runs the given datastore queries of a kind as one query, like MultiQuery
+    does, but with the sub-queries running concurrently.
+
+    Supports the parts of the datastore.Query API used by the compiler:
+    Run(), Get() and Count(), plus iter_keys().
+    """
+
+    def __init__(self, kind, queries, ordering=()):
+        self.kind = kind
+        self.keys_only = queries[0].IsKeysOnly()
+        self.ordering = list(ordering)
+
+        self.queries = []
+        self.orderings = []
+        for query in queries:
+            query_ordering = self.ordering
+            if not query_ordering:
+                # Without explicit orders a sub-query returns its results
+                # sorted by its inequality property (if any), then by key.
+                # Ordering the other sub-queries on that property as well
+                # would drop their entities that don't have it
+                prop = get_inequality_property([query])
+                if prop is not None and prop != '__key__':
+                    query_ordering = [(prop, Query.ASCENDING)]
+
+            # Keys-only results can only be merged on their key, so the
+            # sub-query has to fetch whole entities to sort on properties
+            fetch_entities = bool([prop for prop, direction in query_ordering
+                                   if prop != '__key__'])
+            query = self._copy(query,
+                               keys_only=self.keys_only and not fetch_entities)
+            query.Order(*query_ordering)
+            self.queries.append(query)
+            self.orderings.append(query_ordering)
+
+    def __repr__(self):
+        return '<FanOutQuery: %r ORDER %r>' % (self.queries, self.ordering)
+
+    def _copy(self, query, keys_only):
+        copy = Query(self.kind, keys_only=keys_only)
+        copy.update(query)
+        return copy
+
+    def _sort_key(self, result, ordering):
+        if isinstance(result, Key):
+            key = result
+        else:
+            key = result.key()
+
+        values = []
+        for prop, direction in ordering:
+            if prop == '__key__':
+                value = key
+            else:
+                value = result.get(prop)
+                # Lists are sorted on their smallest value in ascending and
+                # on their largest value in descending order
+                if isinstance(value, list):
+                    if direction == Query.DESCENDING:
+                        value = max(value)
+                    else:
+                        value = min(value)
+            if direction == Query.DESCENDING:
+                value = Descending(value)
+            values.append(value)
+        # Results with equal sort values come in key order
+        values.append(key)
+        return tuple(values)
+
+    def _push(self, heap, index, results):
+        try:
+            result = results.next()
+        except StopIteration:
+            return
+        heapq.heappush(heap, (self._sort_key(result, self.orderings[index]),
+                              index, result))
+
+    def Run(self, offset=0, limit=None):
+        """
+        Yields the merged results of the sub-queries, skipping the first
+        offset ones and stopping after limit results. Without explicit
+        orders the sub-queries can be sorted differently, so the results
+        come in no particular (but a repeatable) order.
+        """
+        limit_all = None
+        if limit is not None:
+            # Each sub-query could provide every one of the results
+            limit_all = offset + limit
+            if limit_all <= 0:
+                return
+
+        # All the sub-queries are started before any of them is read
+        results = [run_async(query, limit_all) for query in self.queries]
+
+        heap = []
+        for index, query_results in enumerate(results):
+            self._push(heap, index, query_results)
+
+        seen = set()
+        returned = 0
+        while heap:
+            sort_key, index, result = heapq.heappop(heap)
+            self._push(heap, index, results[index])
+
+            key = sort_key[-1]
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if offset:
+                offset -= 1
+                continue
+            if self.keys_only:
+                result = key
+            yield result
+            returned += 1
+            if returned == limit:
+                return
+
+    def Get(self, limit, offset=0):
+        return list(self.Run(offset=offset, limit=limit))
+
+    def iter_keys(self, limit=None):
+        """
+        Yields up to limit distinct keys matching the sub-queries, in no
+        particular order.
+        """
+        # Like in Run() all the sub-queries are started before any of them
+        # is read. Each sub-query could provide every one of the keys. The
+        # keys-only queries then continue batch by batch
+        results = [run_async(self._copy(query, keys_only=True), limit)
+                   for query in self.queries]
+
+        seen = set()
+        for keys in results:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield key
+                if len(seen) == limit:
+                    return
+
+    def Count(self, limit=None):
+        # Entities matching several sub-queries are counted once, so the
+        # keys are collected rather than the sub-query counts added up
+        count = 0
+        for key in self.iter_keys(limit):
+            count += 1
+        return count
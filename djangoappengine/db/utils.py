@@ -1,6 +1,17 @@
+from .compiler import MAX_PUT_BATCH_SIZE, put_in_batches
+from django.db import connections, router
+from django.db.models import AutoField
+from django.db.models.sql import InsertQuery
+from google.appengine.api import memcache
 from google.appengine.datastore.datastore_pb import CompiledCursor
+from google.appengine.ext.db.stats import KindStat
 import base64
 
+KIND_COUNT_KEY = 'gae_kind_count:%s'
+
+# The datastore statistics are only updated about once a day
+KIND_COUNT_TIMEOUT = 60 * 60
+
 def get_cursor(queryset):
     # Evaluate QuerySet
     len(queryset)
@@ -18,3 +29,76 @@ def set_cursor(queryset, start=None, end=None):
         queryset.query._gae_end_cursor = end
     # Evaluate QuerySet
     len(queryset)
+
+def bulk_save(objs, using=None, batch_size=MAX_PUT_BATCH_SIZE, raw=False):
+    """Saves many model instances with a few multi-entity Put calls.
+
+    Each instance goes through the same field conversion (and dbindexer
+    index population) as save(), but the entities are put batch_size at a
+    time. Like save() on App Engine, an instance whose primary key is
+    already in use overwrites the existing entity. Instances without a
+    primary key get the assigned one. The save signals are not sent.
+
+    With raw=True the attribute values are stored as they are, like
+    save_base(raw=True) does for fixtures, so e.g. auto_now fields keep
+    their values.
+
+    Returns the primary keys of the instances, in order.
+    """
+    objs = list(objs)
+    entities = []
+    for obj in objs:
+        meta = obj._meta
+        db = using or router.db_for_write(obj.__class__, instance=obj)
+        connection = connections[db]
+        pk_set = obj._get_pk_val(meta) is not None
+        values = [(f, f.get_db_prep_save(raw and getattr(obj, f.attname) or
+                                         f.pre_save(obj, True),
+                                         connection=connection))
+                  for f in meta.local_fields
+                  if pk_set or not isinstance(f, AutoField)]
+
+        query = InsertQuery(obj.__class__)
+        query.insert_values(values)
+        query._gae_put_batch = entities
+        query.get_compiler(using=db).execute_sql()
+        obj._state.db = db
+
+    keys = put_in_batches(entities, batch_size)
+    for obj, key in zip(objs, keys):
+        if obj._meta.has_auto_field and obj._get_pk_val() is None:
+            setattr(obj, obj._meta.pk.attname, key.id_or_name())
+        obj._entity_exists = True
+    return [key.id_or_name() for key in keys]
+
+def get_kind_count(model):
+    """Returns the number of entities of the model's kind according to the
+    datastore statistics, or None if there are no statistics yet.
+    """
+    kind = model._meta.db_table
+    key = KIND_COUNT_KEY % kind
+    count = memcache.get(key)
+    if count is None:
+        stat = KindStat.all().filter('kind_name =', kind).get()
+        # -1 caches the absence of statistics
+        count = stat and stat.count or -1
+        memcache.set(key, count, KIND_COUNT_TIMEOUT)
+    if count < 0:
+        return None
+    return count
+
+def approximate_count(queryset):
+    """Returns a count of the queryset's results that is good enough for
+    display, e.g. "about 12,000 goals".
+
+    Unfiltered querysets are counted from the datastore statistics of their
+    kind, which can be up to a day old, without running any query. Other
+    querysets, and kinds without statistics, are counted exactly.
+    """
+    query = queryset.query
+    if not query.where.children and not query.low_mark and \
+            query.high_mark is None:
+        count = get_kind_count(queryset.model)
+        if count is not None:
+            return count
+    return queryset.count()
@@ -1,7 +1,10 @@
 from .backend import BackendTest
+from .bulk import BulkSaveTest
+from .count import CountTest
 from .field_db_conversion import FieldDBConversionTest
 from .field_options import FieldOptionsTest
 from .filter import FilterTest
 from .order import OrderTest
 from .not_return_sets import NonReturnSetsTest
 from .decimals import DecimalTest
+from .entitycache import EntityCacheTest
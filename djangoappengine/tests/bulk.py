@@ -0,0 +1,32 @@
+from .testmodels import DateTimeModel, EmailModel, OrderedModel
+from djangoappengine.db.utils import bulk_save
+from django.test import TestCase
+import datetime
+
+class BulkSaveTest(TestCase):
+    def test_assigns_ids(self):
+        objs = [EmailModel(email='user%d@example.com' % i) for i in range(5)]
+        ids = bulk_save(objs)
+        self.assertEquals(ids, [obj.pk for obj in objs])
+        self.assertEquals(len(set(ids)), 5)
+        self.assertEquals(EmailModel.objects.get(pk=ids[3]).email,
+                          'user3@example.com')
+
+    def test_batches(self):
+        ids = bulk_save([OrderedModel(id=i + 1, priority=i)
+                         for i in range(12)], batch_size=5)
+        self.assertEquals(ids, range(1, 13))
+        self.assertEquals(OrderedModel.objects.count(), 12)
+        self.assertEquals(OrderedModel.objects.all()[0].priority, 11)
+
+    def test_overwrites(self):
+        bulk_save([OrderedModel(id=1, priority=1)])
+        bulk_save([OrderedModel(id=1, priority=2)])
+        self.assertEquals(OrderedModel.objects.get(pk=1).priority, 2)
+
+    def test_field_conversion(self):
+        obj = DateTimeModel(datetime=datetime.datetime(2010, 11, 21, 12))
+        bulk_save([obj])
+        self.assertNotEquals(obj.datetime_auto_now, None)
+        self.assertEquals(DateTimeModel.objects.get(pk=obj.pk).datetime_auto_now,
+                          obj.datetime_auto_now)
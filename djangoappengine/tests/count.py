@@ -0,0 +1,35 @@
+from .testmodels import EmailModel, OrderedModel
+from django.test import TestCase
+from djangoappengine.db.utils import approximate_count, bulk_save
+
+class CountTest(TestCase):
+    def setUp(self):
+        bulk_save([OrderedModel(id=i + 1, priority=i % 10)
+                   for i in range(1100)])
+
+    def test_count(self):
+        # more keys than fit into a single batch
+        self.assertEquals(OrderedModel.objects.count(), 1100)
+        self.assertEquals(OrderedModel.objects.filter(priority=3).count(), 110)
+        self.assertEquals(OrderedModel.objects.all()[:1050].count(), 1050)
+
+    def test_count_excluded_pks(self):
+        self.assertEquals(OrderedModel.objects.exclude(
+                          pk__in=[1, 2, 3]).count(), 1097)
+        self.assertEquals(OrderedModel.objects.exclude(
+                          pk__in=[1, 2, 3])[:10].count(), 10)
+
+    def test_count_in(self):
+        self.assertEquals(OrderedModel.objects.filter(
+                          priority__in=[1, 2, 3]).count(), 330)
+
+    def test_exists(self):
+        self.assertTrue(OrderedModel.objects.filter(priority=3).exists())
+        self.assertFalse(OrderedModel.objects.filter(priority=10).exists())
+        self.assertFalse(EmailModel.objects.exists())
+
+    def test_approximate_count(self):
+        # there are no datastore statistics in tests
+        self.assertEquals(approximate_count(OrderedModel.objects.all()), 1100)
+        self.assertEquals(approximate_count(
+                          OrderedModel.objects.filter(priority=3)), 110)
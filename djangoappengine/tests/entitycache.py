@@ -0,0 +1,81 @@
+from .testmodels import EmailModel
+from django.conf import settings
+from django.test import TestCase
+from djangoappengine.db import entitycache
+from google.appengine.api.datastore import Get, Put
+from google.appengine.ext import db
+
+class EntityCacheTest(TestCase):
+    def setUp(self):
+        self.old_setting = getattr(settings, 'GAE_ENTITY_CACHE', False)
+        settings.GAE_ENTITY_CACHE = True
+        entitycache.start_request()
+        self.obj = EmailModel(email='app-engine@scholardocs.com')
+        self.obj.save()
+
+    def tearDown(self):
+        entitycache.end_request()
+        settings.GAE_ENTITY_CACHE = self.old_setting
+
+    def _change_behind_backend(self, email):
+        key = db.Key.from_path(EmailModel._meta.db_table, self.obj.pk)
+        entity = Get(key)
+        entity['email'] = email
+        Put(entity)
+
+    def test_cached(self):
+        EmailModel.objects.get(pk=self.obj.pk)
+        self._change_behind_backend('sharingan@uchias.com')
+        self.assertEquals(EmailModel.objects.get(pk=self.obj.pk).email,
+                          'app-engine@scholardocs.com')
+
+        # memcache tier
+        entitycache.clear()
+        self.assertEquals(EmailModel.objects.get(pk=self.obj.pk).email,
+                          'app-engine@scholardocs.com')
+
+    def test_outside_request(self):
+        entitycache.end_request()
+        EmailModel.objects.get(pk=self.obj.pk)
+        self.assertEquals(entitycache._get_local(), None)
+        self._change_behind_backend('sharingan@uchias.com')
+        # still served from memcache
+        self.assertEquals(EmailModel.objects.get(pk=self.obj.pk).email,
+                          'app-engine@scholardocs.com')
+
+    def test_returns_copies(self):
+        key = db.Key.from_path(EmailModel._meta.db_table, self.obj.pk)
+        first = entitycache.get([key])[0]
+        first['email'] = 'sharingan@uchias.com'
+        second = entitycache.get([key])[0]
+        self.assertFalse(first is second)
+        self.assertEquals(second['email'], 'app-engine@scholardocs.com')
+
+    def test_save_invalidates(self):
+        EmailModel.objects.get(pk=self.obj.pk)
+        self.obj.email = 'rinnengan@sage.de'
+        self.obj.save()
+        self.assertEquals(EmailModel.objects.get(pk=self.obj.pk).email,
+                          'rinnengan@sage.de')
+
+    def test_delete_invalidates(self):
+        EmailModel.objects.get(pk=self.obj.pk)
+        EmailModel.objects.filter(pk=self.obj.pk).delete()
+        self.assertRaises(EmailModel.DoesNotExist, EmailModel.objects.get,
+                          pk=self.obj.pk)
+
+    def test_pk_in(self):
+        other = EmailModel(email='rasengan@naruto.com')
+        other.save()
+        EmailModel.objects.get(pk=self.obj.pk)
+        self.assertEquals([entity.email for entity in
+                           EmailModel.objects.filter(
+                           pk__in=[other.pk, self.obj.pk, 0]).order_by('email')],
+                          ['app-engine@scholardocs.com', 'rasengan@naruto.com'])
+
+    def test_transaction(self):
+        EmailModel.objects.get(pk=self.obj.pk)
+        self._change_behind_backend('sharingan@uchias.com')
+        self.assertEquals(db.run_in_transaction(
+                          lambda: EmailModel.objects.get(pk=self.obj.pk).email),
+                          'sharingan@uchias.com')
@@ -59,5 +59,35 @@ class FieldDBConversionTest(TestCase):
             self.assertTrue(type(getattr(entity, name)) in (isinstance(
                 expected_type, (list, tuple)) and expected_type or (expected_type, )))
 
+    def test_converters(self):
+        actual_datetime = datetime.datetime.now()
+        FieldsWithoutOptionsModel(
+            datetime=actual_datetime, date=actual_datetime.date(),
+            time=actual_datetime.time(), floating_point=5.97, boolean=True,
+            null_boolean=None, text='Hallo', email='hallo@hallo.com',
+            comma_seperated_integer="5,4,3,2",
+            ip_address='194.167.1.1', slug='you slugy slut :)',
+            url='http://www.scholardocs.com', long_text=1000*'A',
+            indexed_text='hello', xml=2000*'B',
+            integer=-400, small_integer=-4, positiv_integer=400,
+            positiv_small_integer=4).save()
+
+        # the compiled converters give the same rows as convert_value_from_db
+        query = FieldsWithoutOptionsModel.objects.all().query
+        compiler = query.get_compiler(using='default')
+        fields = compiler.get_fields()
+        converters = compiler.get_converters(fields)
+        self.assertTrue(converters is compiler.get_converters(fields))
+
+        gae_entity = compiler.build_query(fields).fetch(0, None).next()
+        expected = [compiler.convert_value_from_db(
+                        field.db_type(connection=compiler.connection),
+                        gae_entity.get(field.column, field.get_default()))
+                    for field in fields]
+        self.assertEquals(compiler._make_result(gae_entity, fields), expected)
+        self.assertEquals([type(value) for value in
+                           compiler._make_result(gae_entity, fields)],
+                          [type(value) for value in expected])
+
 
 # TODO: Add field conversions for ForeignKeys?
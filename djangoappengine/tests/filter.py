@@ -315,6 +315,42 @@ class FilterTest(TestCase):
                            integer__in=[1, 5, 9])],
                           ['app-engine@scholardocs.com', 'rasengan@naruto.com'])
 
+    def test_in_many_values(self):
+        # more sub-queries than a MultiQuery could run
+        self.assertEquals([entity.integer for entity in
+                           FieldsWithOptionsModel.objects.filter(
+                           integer__in=range(50)).order_by('-integer')],
+                          [9, 5, 2, 1])
+        self.assertEquals([entity.integer for entity in
+                           FieldsWithOptionsModel.objects.filter(
+                           integer__in=range(50)).order_by('integer')[1:3]],
+                          [2, 5])
+        self.assertEquals(FieldsWithOptionsModel.objects.filter(
+                          integer__in=range(50)).count(), 4)
+
+    def test_or(self):
+        self.assertEquals([entity.email for entity in
+                           FieldsWithOptionsModel.objects.filter(
+                           Q(integer=9) | Q(email='app-engine@scholardocs.com')
+                           ).order_by('email')],
+                          ['app-engine@scholardocs.com', 'rinnengan@sage.de'])
+
+        # entities matching several alternatives are only returned once
+        self.assertEquals([entity.integer for entity in
+                           FieldsWithOptionsModel.objects.filter(
+                           Q(integer__gte=5) | Q(integer__lt=3) |
+                           Q(integer=9)).order_by('integer')],
+                          [1, 2, 5, 9])
+        self.assertEquals(FieldsWithOptionsModel.objects.filter(
+                          Q(integer__gte=5) | Q(integer=9)).count(), 2)
+
+        # combined with AND filters
+        self.assertEquals([entity.integer for entity in
+                           FieldsWithOptionsModel.objects.filter(
+                           Q(integer=1) | Q(integer=2) | Q(integer=9),
+                           floating_point__gt=2.0).order_by('floating_point')],
+                          [2, 9])
+
     def test_in_with_pk_in(self):
         self.assertEquals([entity.email for entity in
                            FieldsWithOptionsModel.objects.filter(
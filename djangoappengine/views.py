@@ -1,11 +1,20 @@
 from django.conf import settings
 from django.utils.importlib import import_module
 from django.http import HttpResponse
+import logging
+
+def _get_callable(path):
+    module, attr = path.rsplit('.', 1)
+    return getattr(import_module(module), attr)
 
 def warmup(request):
     """
     Provides default procedure for handling warmup requests on App Engine.
     Just add this view to your main urls.py.
+
+    After importing the urls and views modules it runs the callables listed
+    in the WARMUP_STEPS setting, e.g. to fill caches. A failing step is
+    logged and skipped.
     """
     for app in settings.INSTALLED_APPS:
         for name in ('urls', 'views'):
@@ -13,5 +22,12 @@ def warmup(request):
                 import_module('%s.%s' % (app, name))
             except ImportError:
                 pass
+
+    for path in getattr(settings, 'WARMUP_STEPS', ()):
+        try:
+            _get_callable(path)()
+        except Exception:
+            logging.exception('Warmup step %s failed' % path)
+
     content_type = 'text/plain; charset=%s' % settings.DEFAULT_CHARSET
     return HttpResponse('Warmup done', content_type=content_type)
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.db.models.fields import NOT_PROVIDED
 from django.db.models.sql import aggregates as sqlaggregates
 from django.db.models.sql.compiler import SQLCompiler
 from django.db.models.sql.constants import LOOKUP_SEP, MULTI, SINGLE
@@ -215,8 +216,9 @@ class NonrelCompiler(SQLCompiler):
         fields = self.get_fields()
         low_mark = self.query.low_mark
         high_mark = self.query.high_mark
+        converters = self.get_converters(fields)
         for entity in self.build_query(fields).fetch(low_mark, high_mark):
-            yield self._make_result(entity, fields)
+            yield self._convert_entity(entity, converters)
 
     def has_results(self):
         return self.get_count(check_exists=True)
@@ -243,16 +245,51 @@ class NonrelCompiler(SQLCompiler):
     # ----------------------------------------------
     # Additional NonrelCompiler API
     # ----------------------------------------------
-    def _make_result(self, entity, fields):
+    def get_converters(self, fields):
+        """
+        Returns a (column, get_default, null, name, convert) tuple per field,
+        holding everything needed to turn an entity into a row. They only
+        depend on the fields, so they are built once and cached on the
+        compiler class.
+        """
+        cache = self.__class__.__dict__.get('_converters')
+        if cache is None:
+            cache = self.__class__._converters = {}
+        key = (self.connection.alias, tuple(fields))
+        converters = cache.get(key)
+        if converters is None:
+            converters = cache[key] = [
+                (field.column, field.get_default, field.null, field.name,
+                 self.get_value_converter(field.db_type(
+                     connection=self.connection)))
+                for field in fields]
+        return converters
+
+    def get_value_converter(self, db_type):
+        """
+        Returns a function converting database values of db_type, called
+        as convert(compiler, value). Backends can return specialized
+        functions here instead of going through convert_value_from_db()
+        for every value.
+        """
+        def convert(compiler, value):
+            return compiler.convert_value_from_db(db_type, value)
+        return convert
+
+    def _convert_entity(self, entity, converters):
         result = []
-        for field in fields:
-            if not field.null and entity.get(field.column,
-                    field.get_default()) is None:
-                raise DatabaseError("Non-nullable field %s can't be None!" % field.name)
-            result.append(self.convert_value_from_db(field.db_type(
-                connection=self.connection), entity.get(field.column, field.get_default())))
+        for column, get_default, null, name, convert in converters:
+            value = entity.get(column, NOT_PROVIDED)
+            if value is NOT_PROVIDED:
+                value = get_default()
+            if value is None and not null:
+                raise DatabaseError("Non-nullable field %s can't be None!" % name)
+            result.append(convert(self, value))
         return result
 
+    def _make_result(self, entity, fields):
+        return self._convert_entity(entity, self.get_converters(fields))
+
     def check_query(self):
         if (len([a for a in self.query.alias_map if self.query.alias_refcount[a]]) > 1
                 or self.query.distinct or self.query.extra or self.query.having):
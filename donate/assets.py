@@ -0,0 +1,229 @@
+"""
+The static asset pipeline. "manage.py build_static" collects the files of
+STATICFILES_DIRS with the django.contrib.staticfiles finders, concatenates
+and minifies the STATIC_BUNDLES, and writes every file to STATICFILES_ROOT
+under a name containing a hash of its content, along with a gzipped copy.
+app.yaml serves that directory directly with a far-future expiration, so
+asset requests never reach Django and a changed file gets a new URL.
+
+The hashed names are recorded in STATIC_MANIFEST, which the static_assets
+template tags read. Without a manifest (e.g. in tests) the tags fall back
+to the source files.
+"""
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.utils.hashcompat import md5_constructor
+import gzip
+import os
+import posixpath
+import re
+import shutil
+import simplejson
+
+# jsmin is optional. Without it JavaScript is only concatenated
+try:
+    from jsmin import jsmin
+except ImportError:
+    jsmin = None
+
+# Files matching these patterns are never collected
+IGNORE_PATTERNS = ["CVS", ".*", "*~", "*.txt"]
+
+# Extensions of the files that also get a gzipped copy
+COMPRESSIBLE = (".css", ".js", ".svg", ".html")
+
+# Lines delimiting the handler written into app.yaml
+APP_YAML_BEGIN = "# BEGIN static assets (generated by manage.py build_static)"
+APP_YAML_END = "# END static assets"
+
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+CSS_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.S)
+
+def minify_css(content):
+    """
+    Strips comments and redundant whitespace from a stylesheet
+    """
+    content = CSS_COMMENT_PATTERN.sub("", content)
+    content = re.sub(r"\s+", " ", content)
+    content = re.sub(r"\s*([{};,])\s*", r"\1", content)
+    return content.replace(";}", "}").strip() + "\n"
+
+def minify_js(content):
+    if jsmin is None:
+        return content
+    return jsmin(content) + "\n"
+
+def hashed_name(name, content):
+    """
+    Returns the name of a file with the hash of its content inserted
+    before the extension, e.g. css/site.0a1b2c3d4e5f.css
+    """
+    root, ext = posixpath.splitext(name)
+    return "%s.%s%s" % (root, md5_constructor(content).hexdigest()[:12], ext)
+
+def collect():
+    """
+    Returns {name: content} of all the files found by the staticfiles
+    finders. Like collectstatic, the first file found for a name wins.
+    """
+    files = {}
+    for finder in get_finders():
+        for path, prefix, storage in finder.list(IGNORE_PATTERNS):
+            name = path.replace(os.sep, "/")
+            if prefix:
+                name = posixpath.join(prefix, name)
+            if name not in files:
+                source = storage.open(path)
+                try:
+                    files[name] = source.read()
+                finally:
+                    source.close()
+    return files
+
+def rewrite_css_urls(name, content, manifest):
+    """
+    Points the url() references of the stylesheet called name at the
+    hashed files. Relative references are resolved against the stylesheet
+    so they survive being moved into a bundle.
+    """
+    prefix = settings.STATICFILES_URL
+
+    def rewrite(match):
+        url = match.group(2)
+        if url.startswith(prefix):
+            target = url[len(prefix):]
+        elif "://" in url or url.startswith("/") or url.startswith("data:"):
+            return match.group(0)
+        else:
+            target = posixpath.normpath(
+                posixpath.join(posixpath.dirname(name), url))
+        return "url(%s%s)" % (prefix, manifest.get(target, target))
+    return CSS_URL_PATTERN.sub(rewrite, content)
+
+def build(files, bundles):
+    """
+    Returns the {hashed name: content} files and the {name: hashed name}
+    manifest built from the collected files and the bundles.
+    """
+    manifest = {}
+    output = {}
+
+    def add(name, content):
+        if name.endswith(".css"):
+            content = minify_css(rewrite_css_urls(name, content, manifest))
+        elif name.endswith(".js"):
+            content = minify_js(content)
+        manifest[name] = hashed_name(name, content)
+        output[manifest[name]] = content
+
+    # Stylesheets refer to the other files, so they are hashed last
+    for name in sorted(files, key=lambda n: (n.endswith(".css"), n)):
+        add(name, files[name])
+
+    for name, sources in sorted(bundles.items()):
+        parts = []
+        for source in sources:
+            content = files[source]
+            if name.endswith(".css"):
+                # resolve relative references against the source file
+                content = rewrite_css_urls(source, content, manifest)
+            parts.append(content)
+        add(name, "\n".join(parts))
+
+    return output, manifest
+
+def write(output, manifest, root, manifest_path):
+    """
+    Replaces the contents of root with the built files and their gzipped
+    copies, and writes the manifest.
+    """
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+    for name, content in output.items():
+        path = os.path.join(root, *name.split("/"))
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, "wb")
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+        if name.endswith(COMPRESSIBLE):
+            f = gzip.open(path + ".gz", "wb", 9)
+            try:
+                f.write(content)
+            finally:
+                f.close()
+
+    f = open(manifest_path, "w")
+    try:
+        simplejson.dump(manifest, f, indent=4, sort_keys=True)
+    finally:
+        f.close()
+
+def app_yaml_handler(url, directory, expiration):
+    return "\n".join([
+        APP_YAML_BEGIN,
+        "- url: %s" % url.rstrip("/"),
+        "  static_dir: %s" % directory,
+        "  expiration: '%s'" % expiration,
+        APP_YAML_END,
+    ])
+
+def update_app_yaml(path, handler):
+    """
+    Writes the static handler into app.yaml, replacing the one written by
+    a previous build or, the first time, in front of the catch-all handler.
+    """
+    f = open(path)
+    try:
+        content = f.read()
+    finally:
+        f.close()
+
+    if APP_YAML_BEGIN in content:
+        start = content.index(APP_YAML_BEGIN)
+        end = content.index(APP_YAML_END, start) + len(APP_YAML_END)
+        content = content[:start] + handler + content[end:]
+    else:
+        content = content.replace("- url: /.*", handler + "\n\n- url: /.*", 1)
+
+    f = open(path, "w")
+    try:
+        f.write(content)
+    finally:
+        f.close()
+
+_manifest = None
+
+def get_manifest():
+    """
+    Returns the {name: hashed name} manifest of the last build, or an empty
+    one if the assets haven't been built.
+    """
+    global _manifest
+    if _manifest is None:
+        try:
+            f = open(settings.STATIC_MANIFEST)
+            try:
+                _manifest = simplejson.load(f)
+            finally:
+                f.close()
+        except IOError:
+            _manifest = {}
+    return _manifest
+
+def get_urls(name):
+    """
+    Returns the URLs to load the asset called name from. That's the URL of
+    the hashed file once the assets are built, otherwise the URLs of the
+    sources of a bundle or of the file itself.
+    """
+    prefix = settings.STATICFILES_URL
+    manifest = get_manifest()
+    if name in manifest:
+        return [prefix + manifest[name]]
+    sources = settings.STATIC_BUNDLES.get(name, (name,))
+    return [prefix + source for source in sources]
@@ -0,0 +1,113 @@
+"""
+Time-series binning for the goal charts. Events are bucketed by an integer
+offset from the application's start date in a single pass, so the cost is
+linear in the number of events plus the number of buckets and the buckets
+come out in date order without any sorting.
+"""
+from datetime import date, datetime, timedelta
+
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+
+GRANULARITIES = (DAY, WEEK, MONTH)
+
+# Labels used by the chart templates for each granularity
+LABELS = {
+    DAY: ("Daily", "days"),
+    WEEK: ("Weekly", "weeks"),
+    MONTH: ("Monthly", "months"),
+}
+
+# The number of buckets a chart should show before we switch to the next
+# coarser granularity
+MAX_BUCKETS = 90
+
+def _to_date(value):
+    """
+    Returns the date part of a date or datetime
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def bucket_index(start, value, granularity=DAY):
+    """
+    Returns the zero-based index of the bucket holding the given date or
+    datetime for a series starting at start.
+    """
+    start, value = _to_date(start), _to_date(value)
+    if granularity == DAY:
+        return (value - start).days
+    if granularity == WEEK:
+        return (value - start).days // 7
+    if granularity == MONTH:
+        return (value.year - start.year) * 12 + value.month - start.month
+    raise ValueError("Unknown granularity %r" % granularity)
+
+def bucket_date(start, index, granularity=DAY):
+    """
+    Returns the first date of the bucket with the given index. Monthly
+    buckets start on the first day of the month.
+    """
+    start = _to_date(start)
+    if granularity == DAY:
+        return start + timedelta(days=index)
+    if granularity == WEEK:
+        return start + timedelta(days=index * 7)
+    if granularity == MONTH:
+        year, month = divmod(start.month - 1 + index, 12)
+        return date(start.year + year, month + 1, 1)
+    raise ValueError("Unknown granularity %r" % granularity)
+
+def choose_granularity(start, end, max_buckets=MAX_BUCKETS):
+    """
+    Returns the finest granularity that covers start..end with at most
+    max_buckets buckets, falling back to monthly buckets.
+    """
+    for granularity in (DAY, WEEK):
+        if bucket_index(start, end, granularity) < max_buckets:
+            return granularity
+    return MONTH
+
+def _empty_buckets(start, end, granularity):
+    buckets = []
+    for n in range(bucket_index(start, end, granularity) + 1):
+        d = bucket_date(start, n, granularity)
+        buckets.append({
+            "x": n,
+            "date_string": "%d/%d/%d" % (d.month, d.day, d.year),
+            "y": 0,
+        })
+    return buckets
+
+def bin_sum(start, end, events, granularity=DAY):
+    """
+    Buckets (date, value) events between start and end, summing the values
+    of each bucket. Returns the list of {"x", "date_string", "y"} points
+    used by the charts, one per bucket and in date order. Events outside
+    of start..end are ignored.
+    """
+    buckets = _empty_buckets(start, end, granularity)
+    size = len(buckets)
+    for when, value in events:
+        n = bucket_index(start, when, granularity)
+        if 0 <= n < size:
+            buckets[n]["y"] += value
+    return buckets
+
+def bin_last(start, end, events, granularity=DAY):
+    """
+    Buckets (datetime, value) events between start and end, keeping the
+    value of the latest event of each bucket. The events don't need to be
+    sorted. Buckets without events have a value of 0.
+    """
+    buckets = _empty_buckets(start, end, granularity)
+    size = len(buckets)
+    latest = [None] * size
+    for when, value in events:
+        n = bucket_index(start, when, granularity)
+        if 0 <= n < size and (latest[n] is None or when > latest[n]):
+            latest[n] = when
+            buckets[n]["y"] = value
+    return buckets
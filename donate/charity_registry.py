@@ -0,0 +1,66 @@
+"""
+A process-local registry of the Charity table. Charities almost never
+change, so they are kept in an in-instance dict backed by memcache instead
+of being fetched from the datastore on every request. Saving or deleting a
+Charity invalidates the registry of the current instance and memcache;
+other instances reload from memcache within LOCAL_TIMEOUT.
+"""
+from donate.models import Charity
+from django.core.cache import cache
+import time
+
+CACHE_KEY = "charity_registry"
+
+# Seconds an instance uses its local copy before reloading it from memcache
+LOCAL_TIMEOUT = 60
+
+# {pk: Charity} dict of this instance and when it was loaded
+_registry = None
+_checked = 0
+
+def _load_from_datastore():
+    registry = dict((c.pk, c) for c in Charity.objects.all())
+    cache.set(CACHE_KEY, registry)
+    return registry
+
+def load():
+    """
+    Loads the registry from memcache, falling back to the datastore. Called
+    at warmup and whenever the local copy expires.
+    """
+    global _registry, _checked
+    registry = cache.get(CACHE_KEY)
+    if registry is None:
+        registry = _load_from_datastore()
+    _registry = registry
+    _checked = time.time()
+    return _registry
+
+def _get_registry():
+    if _registry is None or time.time() - _checked > LOCAL_TIMEOUT:
+        return load()
+    return _registry
+
+def invalidate():
+    """
+    Drops the local and the memcache copy of the registry. Called from the
+    post_save and post_delete signals of Charity (see donate.models).
+    """
+    global _registry
+    _registry = None
+    cache.delete(CACHE_KEY)
+
+def get_all():
+    """
+    Returns all charities ordered by primary key
+    """
+    registry = _get_registry()
+    return [registry[pk] for pk in sorted(registry)]
+
+def get_charities(pks):
+    """
+    Returns the charities with the given primary keys, in the same order.
+    Unknown keys are skipped.
+    """
+    registry = _get_registry()
+    return [registry[pk] for pk in pks if pk in registry]
@@ -0,0 +1,75 @@
+"""
+Per-day progress storage. Only the last progress value of a day is charted,
+so update_progress upserts a single DailyProgress row per application and
+day instead of adding a row per submit. The charts then read O(days) rows
+no matter how often the owner updates. Every submit can optionally be kept
+in the ProgressUpdate kind as an audit history (settings.PROGRESS_HISTORY).
+"""
+from djangoappengine.db.utils import bulk_save
+from donate.models import DailyProgress, ProgressUpdate
+from datetime import datetime
+from google.appengine.ext import db
+import settings
+
+def _set_daily_progress(app_id, date, value):
+    """
+    Sets the value of the progress row of the given application and day,
+    creating the row if it does not exist yet. Must be run inside a
+    transaction.
+    """
+    key = DailyProgress.make_key(app_id, date)
+    try:
+        progress = DailyProgress.objects.get(pk=key)
+    except DailyProgress.DoesNotExist:
+        progress = DailyProgress(id=key, application_id=app_id, date=date)
+    progress.value = value
+    progress.save()
+    return progress
+
+def record_progress(app, value, now=None):
+    """
+    Records the owner's progress for the current (UTC) day, replacing any
+    value submitted earlier that day.
+    """
+    now = now or datetime.utcnow()
+    if getattr(settings, "PROGRESS_HISTORY", False):
+        ProgressUpdate(application=app, value=value).save()
+    return db.run_in_transaction(_set_daily_progress, app.id, now.date(),
+                                 float(value))
+
+def get_daily_progress(app):
+    """
+    Returns the progress rows of an application ordered by date
+    """
+    return DailyProgress.objects.filter(application=app).order_by('date')
+
+def get_latest_progress(app):
+    """
+    Returns the most recent DailyProgress of an application or None
+    """
+    rows = DailyProgress.objects.filter(application=app).order_by('-date')[:1]
+    if rows:
+        return rows[0]
+    return None
+
+def rebuild_application(app):
+    """
+    Recomputes the progress rows of an application from its ProgressUpdate
+    history, keeping the last update of each day. This is only needed for
+    data predating the per-day rows.
+    """
+    latest = {}
+    for update in ProgressUpdate.objects.filter(application=app):
+        date = update.created_datetime.date()
+        if date not in latest or update.created_datetime > latest[date][0]:
+            latest[date] = (update.created_datetime, update.value)
+
+    if not latest:
+        return
+
+    DailyProgress.objects.filter(application=app).delete()
+    bulk_save([DailyProgress(id=DailyProgress.make_key(app.id, date),
+                             application=app,
+                             date=date,
+                             value=value)
+               for date, (when, value) in latest.items()])
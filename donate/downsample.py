@@ -0,0 +1,77 @@
+"""
+Downsampling of the chart series. Long running goals can produce more
+buckets than a chart can usefully draw, so the series are reduced to a
+target number of points on the server before they are sent. The progress
+series keeps its shape with largest-triangle-three-buckets (LTTB), which
+picks the points that contribute most to the line. The donation series is
+reduced by summing consecutive buckets, so the amounts still add up.
+
+Both functions take and return the {"x", "date_string", "y"} points built
+by donate.binning.
+"""
+
+def lttb(points, threshold):
+    """
+    Returns threshold points of the series chosen with the
+    largest-triangle-three-buckets algorithm. The first and the last point
+    are always kept. Series that are already short enough are returned as
+    they are.
+    """
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return points
+
+    sampled = [points[0]]
+
+    # The points between the first and the last one are split into
+    # threshold - 2 buckets, and one point is kept per bucket
+    every = float(size - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # The average of the next bucket is the third vertex of the triangles
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, size)
+        next_points = points[next_start:next_end]
+        avg_x = sum([p["x"] for p in next_points]) / float(len(next_points))
+        avg_y = sum([p["y"] for p in next_points]) / float(len(next_points))
+
+        # Keep the point of this bucket forming the largest triangle with
+        # the previously kept point and that average
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]["x"], points[a]["y"]
+        max_area = -1
+        for n in range(start, end):
+            area = abs((ax - avg_x) * (points[n]["y"] - ay) -
+                       (ax - points[n]["x"]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a_next = n
+        sampled.append(points[a_next])
+        a = a_next
+
+    sampled.append(points[-1])
+    return sampled
+
+def sum_buckets(points, threshold):
+    """
+    Returns at most threshold points, each being the sum of a run of
+    consecutive points. The new points take the x value and date of the
+    first point of their run. Series that are already short enough are
+    returned as they are.
+    """
+    size = len(points)
+    if threshold >= size or threshold < 1:
+        return points
+
+    # ceil(size / threshold) points are merged into each new point
+    every = (size + threshold - 1) // threshold
+    sampled = []
+    for start in range(0, size, every):
+        run = points[start:start + every]
+        sampled.append({
+            "x": run[0]["x"],
+            "date_string": run[0]["date_string"],
+            "y": sum([p["y"] for p in run]),
+        })
+    return sampled
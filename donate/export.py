@@ -0,0 +1,88 @@
+"""
+Donation exports. The donations of an application are read from the
+datastore in batches of BATCH_SIZE, each batch starting at the cursor of
+the previous one, and written out row by row from generators, so reading
+only ever holds one batch of entities in memory.
+
+The CGI runtime (runtime: python in app.yaml) buffers the whole response
+though, so the formatted export is held in memory before it is sent, and
+an export has to fit into one request's deadline and response size limit.
+"""
+from donate.models import Donation
+from djangoappengine.db.utils import get_cursor, set_cursor
+from StringIO import StringIO
+import csv
+import simplejson
+
+# The number of donations fetched per datastore query
+BATCH_SIZE = 200
+
+# Export formats and their content types
+CSV = "csv"
+JSON = "json"
+CONTENT_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    JSON: "application/json",
+}
+
+CSV_COLUMNS = ("pay_key", "amount", "created_datetime")
+
+def iter_donations(app):
+    """
+    Yields the completed donations of an application, oldest first, one
+    batch query at a time.
+    """
+    cursor = None
+    while True:
+        query = Donation.objects.filter(application=app, is_active=True) \
+                                .order_by('created_datetime')[:BATCH_SIZE]
+        if cursor is not None:
+            set_cursor(query, start=cursor)
+        donations = list(query)
+
+        for donation in donations:
+            yield donation
+
+        if len(donations) < BATCH_SIZE:
+            break
+        cursor = get_cursor(query)
+
+def _to_row(donation):
+    return (donation.pay_key, str(donation.amount),
+            donation.created_datetime.isoformat())
+
+def iter_csv(app):
+    """
+    Yields the donations of an application as lines of CSV, starting with
+    a header line.
+    """
+    line = StringIO()
+    writer = csv.writer(line)
+
+    def format_row(row):
+        line.seek(0)
+        line.truncate()
+        writer.writerow([unicode(v).encode("utf-8") for v in row])
+        return line.getvalue()
+
+    yield format_row(CSV_COLUMNS)
+    for donation in iter_donations(app):
+        yield format_row(_to_row(donation))
+
+def iter_json(app):
+    """
+    Yields the donations of an application as the pieces of a JSON object
+    holding the application's slug and the list of donations.
+    """
+    yield '{"application": %s, "donations": [' % simplejson.dumps(app.slug)
+    separator = ""
+    for donation in iter_donations(app):
+        yield separator + simplejson.dumps(dict(zip(CSV_COLUMNS,
+                                                    _to_row(donation))))
+        separator = ", "
+    yield "]}"
+
+FORMATTERS = {
+    CSV: iter_csv,
+    JSON: iter_json,
+}
@@ -0,0 +1,170 @@
+"""
+A local stand-in for the PayPal AdaptivePayments API. It answers the Pay
+and PaymentDetails operations with realistic looking JSON responses after a
+configurable latency, and fails a configurable share of the requests. Point
+settings.API_ENDPOINT at it to exercise the donation flow without the
+sandbox, e.g.:
+
+    python donate/fake_paypal.py --port 8082 --latency 0.4 --error-rate 0.01
+
+The bench_donations management command can also run it in-process.
+"""
+from SocketServer import ThreadingMixIn
+from datetime import datetime
+from optparse import OptionParser
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+import random
+import string
+import threading
+import time
+
+# simplejson comes with the App Engine SDK, but this module is also run as
+# a standalone server
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+
+PAY_KEY_CHARS = string.ascii_uppercase + string.digits
+
+def create_pay_key():
+    """
+    Returns a payKey in the format used by PayPal (e.g. AP-0N7151338H1234567)
+    """
+    return "AP-" + "".join([random.choice(PAY_KEY_CHARS) for i in range(17)])
+
+def _envelope(ack):
+    return {
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000-00:00"),
+        "ack": ack,
+        "correlationId": "".join([random.choice(string.hexdigits.lower())
+                                  for i in range(13)]),
+        "build": "1655692",
+    }
+
+def _error(error_id, message):
+    return {
+        "responseEnvelope": _envelope("Failure"),
+        "error": [{
+            "errorId": error_id,
+            "domain": "PLATFORM",
+            "severity": "Error",
+            "category": "Application",
+            "message": message,
+        }],
+    }
+
+class FakeAdaptivePayments(object):
+    """
+    WSGI application emulating the Pay and PaymentDetails operations. Each
+    request sleeps for latency seconds, plus or minus up to jitter seconds,
+    and a share of error_rate of the requests fail with a PayPal error.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payments = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        operation = environ.get("PATH_INFO", "").rstrip("/").rsplit("/", 1)[-1]
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            request = simplejson.loads(environ["wsgi.input"].read(length) or "{}")
+        except ValueError:
+            request = None
+
+        if request is None:
+            response = _error("580001", "Invalid request: could not parse JSON")
+        elif random.random() < self.error_rate:
+            response = _error("520002", "Internal error")
+        elif operation == "Pay":
+            response = self.pay(request)
+        elif operation == "PaymentDetails":
+            response = self.payment_details(request)
+        else:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return ["Unknown operation %s" % operation]
+
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [simplejson.dumps(response)]
+
+    def pay(self, request):
+        receivers = request.get("receiverList", {}).get("receiver", [])
+        if not receivers:
+            return _error("580022", "Invalid request: receiverList is required")
+
+        pay_key = create_pay_key()
+        with self.lock:
+            self.payments[pay_key] = request
+        return {
+            "responseEnvelope": _envelope("Success"),
+            "payKey": pay_key,
+            "paymentExecStatus": "CREATED",
+        }
+
+    def payment_details(self, request):
+        pay_key = request.get("payKey")
+        with self.lock:
+            payment = self.payments.get(pay_key)
+        if payment is None:
+            return _error("580022", "Invalid request: payKey %s" % pay_key)
+
+        return {
+            "responseEnvelope": _envelope("Success"),
+            "payKey": pay_key,
+            "status": "COMPLETED",
+            "actionType": payment.get("actionType"),
+            "currencyCode": payment.get("currencyCode"),
+            "returnUrl": payment.get("returnUrl"),
+            "cancelUrl": payment.get("cancelUrl"),
+            "paymentInfoList": {"paymentInfo": [
+                {"receiver": receiver, "transactionStatus": "COMPLETED"}
+                for receiver in payment["receiverList"]["receiver"]
+            ]},
+        }
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_server(app, host="127.0.0.1", port=0):
+    """
+    Serves the WSGI application from a background thread and returns the
+    server. The port actually used is server.server_port.
+    """
+    server = make_server(host, port, app, server_class=ThreadingWSGIServer,
+                         handler_class=QuietWSGIRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--host", default="127.0.0.1")
+    parser.add_option("--port", type="int", default=8082)
+    parser.add_option("--latency", type="float", default=0.3,
+                      help="seconds each request takes")
+    parser.add_option("--jitter", type="float", default=0.1,
+                      help="random seconds added or removed from the latency")
+    parser.add_option("--error-rate", type="float", default=0.0,
+                      help="share of requests (0 to 1) that fail")
+    options, args = parser.parse_args()
+
+    app = FakeAdaptivePayments(options.latency, options.jitter,
+                               options.error_rate)
+    server = make_server(options.host, options.port, app,
+                         server_class=ThreadingWSGIServer)
+    print "Fake AdaptivePayments listening on http://%s:%d/AdaptivePayments" % (
+        options.host, options.port)
+    server.serve_forever()
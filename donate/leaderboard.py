@@ -0,0 +1,174 @@
+"""
+The "top goals" leaderboard. Ranking every application per request is far
+too expensive, so a cron job rebuilds a small sorted snapshot of the top
+applications instead. The rebuild walks the Application kind in batches of
+BATCH_SIZE, one task per batch chained with datastore cursors, and carries
+the running top SNAPSHOT_SIZE of each metric from task to task. The last
+task stores the snapshot as LeaderboardEntry rows and in memcache, where the
+leaderboard view pages through it.
+"""
+from donate.models import Application, DailyDonationTotal, LeaderboardEntry
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from djangoappengine.db.utils import bulk_save, get_cursor, set_cursor
+from google.appengine.api import taskqueue
+from google.appengine.ext import deferred
+import base64
+import time
+
+# Ranking metrics
+FUNDED = "funded"
+GROWING = "growing"
+METRICS = (FUNDED, GROWING)
+
+# Readable names of the metrics
+LABELS = {
+    FUNDED: "Most funded",
+    GROWING: "Fastest growing",
+}
+
+# The growing metric is the sum of the donations of the last GROWTH_DAYS days
+GROWTH_DAYS = 7
+
+# The number of applications kept per metric
+SNAPSHOT_SIZE = 100
+
+# The number of applications aggregated per task
+BATCH_SIZE = 100
+
+# The number of applications shown per leaderboard page
+PAGE_SIZE = 20
+
+SNAPSHOT_KEY = "leaderboard:%s"
+
+def _get_recent_totals(apps, today):
+    """
+    Returns {app id: sum of the donations of the last GROWTH_DAYS days} for
+    the given applications. The rollup rows have deterministic keys, so this
+    is a single batch get.
+    """
+    dates = [today - timedelta(days=n) for n in range(GROWTH_DAYS)]
+    keys = [DailyDonationTotal.make_key(app.id, date)
+            for app in apps for date in dates]
+    totals = {}
+    for total in DailyDonationTotal.objects.filter(pk__in=keys):
+        totals[total.application_id] = \
+            totals.get(total.application_id, 0) + total.amount
+    return totals
+
+def _merge(top, candidates):
+    """
+    Merges (value, app id, slug, name) candidates into the top list and
+    returns the SNAPSHOT_SIZE highest ones. Ties are broken by app id so
+    the order is stable between rebuilds.
+    """
+    merged = top + [c for c in candidates if c[0] > 0]
+    merged.sort(key=lambda c: (-c[0], c[1]))
+    return merged[:SNAPSHOT_SIZE]
+
+def aggregate_batch(cursor=None, funded=(), growing=(), today=None):
+    """
+    Task aggregating the next batch of applications into the running top
+    lists. Schedules the task for the following batch, or stores the
+    snapshot once all applications have been seen.
+    """
+    today = today or datetime.utcnow().date()
+    query = Application.objects.filter(is_active=True)[:BATCH_SIZE]
+    if cursor is not None:
+        set_cursor(query, start=cursor)
+    apps = list(query)
+
+    recent = _get_recent_totals(apps, today)
+    funded = _merge(list(funded),
+        [(app.total_donations, app.id, app.slug, app.name) for app in apps])
+    growing = _merge(list(growing),
+        [(recent.get(app.id, 0), app.id, app.slug, app.name) for app in apps])
+
+    if len(apps) == BATCH_SIZE:
+        deferred.defer(aggregate_batch, get_cursor(query), funded, growing,
+                       today)
+        return
+
+    save_snapshot(FUNDED, funded)
+    save_snapshot(GROWING, growing)
+
+def start_rebuild():
+    """
+    Starts a rebuild of the snapshots. Rebuilds are named after the
+    current minute so overlapping cron runs don't start it twice.
+    """
+    try:
+        deferred.defer(aggregate_batch,
+                       _name="leaderboard-%d" % (int(time.time()) // 60))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+def save_snapshot(metric, top):
+    """
+    Stores the ranked applications of a metric as LeaderboardEntry rows and
+    in memcache. Rows ranked beyond the new snapshot are removed.
+    """
+    entries = []
+    for rank, (value, app_id, slug, name) in enumerate(top):
+        entries.append(LeaderboardEntry(
+            id=LeaderboardEntry.make_key(metric, rank + 1),
+            metric=metric,
+            rank=rank + 1,
+            application_id=app_id,
+            application_slug=slug,
+            application_name=name,
+            value=value))
+    # One multi-entity Put instead of a Put per row
+    bulk_save(entries)
+
+    LeaderboardEntry.objects.filter(metric=metric, rank__gt=len(top)).delete()
+    cache.set(SNAPSHOT_KEY % metric, [_to_dict(e) for e in entries])
+
+def _to_dict(entry):
+    return {
+        "rank": entry.rank,
+        "slug": entry.application_slug,
+        "name": entry.application_name,
+        "value": entry.value,
+    }
+
+def get_snapshot(metric):
+    """
+    Returns the ranked applications of a metric as a list of dicts, reading
+    the rows back into memcache if it was evicted.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY % metric)
+    if snapshot is None:
+        entries = LeaderboardEntry.objects.filter(metric=metric).order_by('rank')
+        snapshot = [_to_dict(e) for e in entries]
+        cache.set(SNAPSHOT_KEY % metric, snapshot)
+    return snapshot
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset))
+
+def decode_cursor(cursor):
+    """
+    Returns the snapshot offset of a page cursor. Raises ValueError for
+    cursors we didn't hand out.
+    """
+    try:
+        offset = int(base64.urlsafe_b64decode(str(cursor)))
+    except TypeError:
+        raise ValueError("Invalid cursor %r" % cursor)
+    if offset < 0:
+        raise ValueError("Invalid cursor %r" % cursor)
+    return offset
+
+def get_page(metric, cursor=None):
+    """
+    Returns a page of the snapshot of a metric starting at cursor, along
+    with the cursor of the next page (None on the last page).
+    """
+    snapshot = get_snapshot(metric)
+    offset = cursor and decode_cursor(cursor) or 0
+    page = snapshot[offset:offset + PAGE_SIZE]
+    next_cursor = None
+    if offset + PAGE_SIZE < len(snapshot):
+        next_cursor = encode_cursor(offset + PAGE_SIZE)
+    return page, next_cursor
@@ -0,0 +1,149 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client import Client
+from donate.fake_paypal import FakeAdaptivePayments, start_server
+from donate.models import Application, Charity
+from donate import paypal
+from optparse import make_option
+import re
+import settings
+import threading
+import time
+
+PAY_KEY_PATTERN = re.compile(r"paykey=(AP-[A-Z0-9]+)")
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile (0-100) of a sorted list of values
+    """
+    if not values:
+        return 0.0
+    index = int(round(p / 100.0 * (len(values) - 1)))
+    return values[index]
+
+def get_benchmark_application():
+    """
+    Returns the application donations are made to, creating it (and the
+    charities from settings.CHARITIES) when needed.
+    """
+    try:
+        return Application.objects.get(slug="benchmark-goal")
+    except Application.DoesNotExist:
+        pass
+
+    if not Charity.objects.exists():
+        for name, email in settings.CHARITIES:
+            Charity(name=name, email=email).save()
+
+    try:
+        user = User.objects.get(username="benchmark@example.com")
+    except User.DoesNotExist:
+        user = User.objects.create_user(username="benchmark@example.com",
+                                        email="benchmark@example.com",
+                                        password="password")
+
+    app = Application(user=user,
+                      name="Benchmark Goal",
+                      slug="benchmark-goal",
+                      description="Donation flow benchmark",
+                      goal_value=100,
+                      goal_units_singular="run",
+                      goal_units_plural="runs",
+                      charities=[c.pk for c in Charity.objects.all()])
+    app.save()
+    return app
+
+class Command(BaseCommand):
+    help = 'Drives the donate -> finish_donation flow through the Django ' \
+           'test client at increasing concurrency and reports throughput ' \
+           'and latency percentiles. By default PayPal is replaced with ' \
+           'the local fake from donate.fake_paypal. Every flow uses a new ' \
+           'client, so Pay request coalescing never answers from memcache ' \
+           'and each flow measures a Pay round trip.'
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency', default='1,2,4,8,16',
+            help='Comma separated list of concurrency levels to run'),
+        make_option('--flows', type='int', default=50,
+            help='Number of donation flows run per worker and level'),
+        make_option('--endpoint', default=None,
+            help='AdaptivePayments endpoint to use instead of the fake'),
+        make_option('--latency', type='float', default=0.3,
+            help='Latency in seconds of the fake PayPal endpoint'),
+        make_option('--jitter', type='float', default=0.1,
+            help='Latency jitter in seconds of the fake PayPal endpoint'),
+        make_option('--error-rate', type='float', default=0.0,
+            help='Share of failing requests of the fake PayPal endpoint'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(c) for c in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a list of integers')
+
+        server = None
+        endpoint = options['endpoint']
+        if endpoint is None:
+            fake = FakeAdaptivePayments(options['latency'], options['jitter'],
+                                        options['error_rate'])
+            server = start_server(fake)
+            endpoint = 'http://127.0.0.1:%d/AdaptivePayments' % server.server_port
+        paypal.settings.API_ENDPOINT = endpoint
+
+        app = get_benchmark_application()
+        print 'Benchmarking %s against %s' % (app.slug, endpoint)
+        print '%6s %8s %8s %10s %8s %8s %8s %8s' % ('conc', 'flows', 'errors',
+            'flows/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')
+
+        try:
+            for level in levels:
+                self.run_level(app, level, options['flows'])
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    def run_level(self, app, concurrency, flows):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            for i in range(flows):
+                start = time.time()
+                ok = self.run_flow(app)
+                elapsed = time.time() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors.append(elapsed)
+
+        threads = [threading.Thread(target=worker) for i in range(concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.time() - start
+
+        latencies.sort()
+        ms = lambda p: percentile(latencies, p) * 1000
+        print '%6d %8d %8d %10.1f %8.0f %8.0f %8.0f %8.0f' % (concurrency,
+            len(latencies), len(errors), len(latencies) / wall,
+            ms(50), ms(90), ms(99), ms(100))
+
+    def run_flow(self, app):
+        """
+        Runs one donation through donate and finish_donation. Returns whether
+        the flow completed. A fresh client gets its own CSRF cookie, which
+        paypal.coalesce_pay_request keys on, so like a new visitor it never
+        gets the payKey of an earlier flow.
+        """
+        client = Client()
+        response = client.post('/donate', {'app_id': app.pk, 'donation': '5.00'})
+        match = PAY_KEY_PATTERN.search(response.content)
+        if response.status_code != 200 or match is None:
+            return False
+
+        response = client.get('/finish_donation', {'payKey': match.group(1)})
+        return response.status_code == 302
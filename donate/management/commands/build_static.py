@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from donate import assets
+from optparse import make_option
+import os
+
+class Command(BaseCommand):
+    help = 'Builds the static files into STATICFILES_ROOT with hashed ' \
+           'names, minified bundles and gzipped copies, and writes the ' \
+           'app.yaml handler serving them. Run it before deploying.'
+    option_list = BaseCommand.option_list + (
+        make_option('--expiration', default='365d',
+            help='Expiration of the static files in app.yaml'),
+        make_option('--no-app-yaml', action='store_false', dest='app_yaml',
+            default=True, help="Don't update app.yaml"),
+    )
+
+    def handle(self, *args, **options):
+        files = assets.collect()
+        output, manifest = assets.build(files, settings.STATIC_BUNDLES)
+        root = settings.STATICFILES_ROOT
+        assets.write(output, manifest, root, settings.STATIC_MANIFEST)
+        print 'Wrote %d files to %s' % (len(output), root)
+        if assets.jsmin is None:
+            print 'jsmin is not installed, JavaScript was not minified'
+
+        if options['app_yaml']:
+            project = os.path.dirname(settings.STATIC_MANIFEST)
+            handler = assets.app_yaml_handler(settings.STATICFILES_URL,
+                os.path.relpath(root, project).replace(os.sep, '/'),
+                options['expiration'])
+            assets.update_app_yaml(os.path.join(project, 'app.yaml'), handler)
+            print 'Updated the static handler in app.yaml'
@@ -0,0 +1,291 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from djangoappengine.db.compiler import MAX_PUT_BATCH_SIZE
+from djangoappengine.db.utils import bulk_save
+from donate.models import Application, Charity, DailyDonationTotal, \
+    DailyProgress, Donation, ProgressUpdate
+from google.appengine.api.datastore import AllocateIds, Key
+from optparse import make_option
+import random
+import settings
+import string
+
+# Share of donations whose PayPal flow was never finished
+ABANDONED_SHARE = 0.15
+
+PAY_KEY_CHARS = string.ascii_uppercase + string.digits
+
+def zipf_weights(n, exponent):
+    """
+    Returns the cumulative Zipf weights of n ranks. Rank 1 is the most
+    popular one.
+    """
+    cumulative = []
+    total = 0.0
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+def distribute(total, cumulative):
+    """
+    Splits total into as many counts as there are cumulative weights,
+    proportionally to the weights.
+    """
+    counts = []
+    assigned = 0
+    for weight in cumulative:
+        target = int(round(total * weight / cumulative[-1]))
+        counts.append(target - assigned)
+        assigned = target
+    return counts
+
+class BatchWriter(object):
+    """
+    Buffers model instances and writes them with multi-entity Puts. The
+    instances go through the backend's own value conversion and index
+    population, so the stored entities are the same as those written by
+    Model.save(), only with their timestamps kept.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = min(batch_size, MAX_PUT_BATCH_SIZE)
+        self.objs = []
+        self.written = 0
+
+    def add(self, obj):
+        self.objs.append(obj)
+        if len(self.objs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.objs:
+            bulk_save(self.objs, batch_size=self.batch_size, raw=True)
+            self.written += len(self.objs)
+            self.objs = []
+
+def allocate_ids(model, count):
+    """
+    Reserves count ids for the model's kind so they can't collide with ids
+    assigned by the datastore later on.
+    """
+    start, end = AllocateIds(Key.from_path(model._meta.db_table, 1), size=count)
+    return range(start, end + 1)
+
+class Command(BaseCommand):
+    help = 'Generates realistic load data (users, applications, donations, ' \
+           'progress updates and their rollups) with batched writes. The ' \
+           'same --seed and --end generate the same data apart from the ' \
+           'ids, which the datastore allocates. Generated usernames and ' \
+           'slugs must be unique, so the command refuses to run on a ' \
+           'datastore that already holds generated data.'
+    option_list = BaseCommand.option_list + (
+        make_option('--seed', type='int', default=1,
+            help='Seed of the random number generator'),
+        make_option('--users', type='int', default=2000),
+        make_option('--applications', type='int', default=5000),
+        make_option('--donations', type='int', default=1000000),
+        make_option('--updates', type='int', default=1000000),
+        make_option('--days', type='int', default=365,
+            help='Applications are created during the last DAYS days'),
+        make_option('--end', default=None,
+            help='Date (YYYY-MM-DD) the generated history ends at. '
+                 'Defaults to today'),
+        make_option('--popularity', type='float', default=1.1,
+            help='Zipf exponent of the donations and updates per application'),
+        make_option('--batch-size', type='int', default=MAX_PUT_BATCH_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        if options['end']:
+            try:
+                end = datetime.strptime(options['end'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--end must be a date in the format YYYY-MM-DD')
+        else:
+            now = datetime.utcnow()
+            end = datetime(now.year, now.month, now.day)
+        if min(options['users'], options['applications']) < 1:
+            raise CommandError('--users and --applications must be positive')
+
+        if User.objects.filter(username='user0@example.com').exists() or \
+                Application.objects.filter(slug='load-goal-0').exists():
+            raise CommandError('The datastore already holds generated load '
+                               'data. Generate it into an empty datastore')
+
+        self.rng = random.Random(options['seed'])
+        self.end = end
+        self.writer = BatchWriter(options['batch_size'])
+
+        charities = self.get_charities()
+        users = self.generate_users(options['users'])
+        apps = self.generate_applications(options['applications'],
+                                          options['days'], users, charities)
+
+        popularity = zipf_weights(len(apps), options['popularity'])
+        totals = self.generate_donations(apps,
+            distribute(options['donations'], popularity))
+        self.generate_updates(apps, distribute(options['updates'], popularity))
+        self.write_applications(apps, totals)
+        self.writer.flush()
+
+        print 'Wrote %d entities' % self.writer.written
+
+    def get_charities(self):
+        charities = list(Charity.objects.all())
+        if not charities:
+            for name, email in settings.CHARITIES:
+                charity = Charity(name=name, email=email)
+                charity.save()
+                charities.append(charity)
+        return [c.pk for c in charities]
+
+    def generate_users(self, count):
+        # Hashing a password is slow, so all users share the same one
+        password = User()
+        password.set_password('password')
+
+        ids = allocate_ids(User, count)
+        for n, user_id in enumerate(ids):
+            email = 'user%d@example.com' % n
+            joined = self.end - timedelta(seconds=self.rng.randrange(3600 * 24 * 730))
+            self.writer.add(User(id=user_id,
+                                 username=email,
+                                 email=email,
+                                 first_name='User',
+                                 last_name=str(n),
+                                 password=password.password,
+                                 is_staff=False,
+                                 is_active=True,
+                                 is_superuser=False,
+                                 last_login=joined,
+                                 date_joined=joined))
+        print 'Generated %d users' % count
+        return ids
+
+    def generate_applications(self, count, days, users, charities):
+        """
+        Returns the generated applications, ordered by popularity. They are
+        only written once their totals are known.
+        """
+        apps = []
+        for n, app_id in enumerate(allocate_ids(Application, count)):
+            created = self.end - timedelta(
+                seconds=self.rng.randrange(max(days, 1) * 3600 * 24))
+            goal = self.rng.choice((10, 20, 25, 50, 100, 250, 1000))
+            supported = self.rng.sample(charities,
+                                        self.rng.randint(1, len(charities)))
+            apps.append(Application(id=app_id,
+                                    user_id=self.rng.choice(users),
+                                    name='Load Goal %d' % n,
+                                    slug='load-goal-%d' % n,
+                                    description='Generated goal number %d' % n,
+                                    goal_value=goal,
+                                    goal_units_singular='mile',
+                                    goal_units_plural='miles',
+                                    charities=supported,
+                                    created_datetime=created,
+                                    updated_datetime=created,
+                                    is_active=True))
+        print 'Generated %d applications' % count
+        return apps
+
+    def random_datetime(self, start):
+        """
+        Returns a datetime between start and the end of the history. Most
+        activity happens right after a goal is created, so the offsets are
+        skewed towards start.
+        """
+        delta = self.end - start
+        seconds = delta.days * 3600 * 24 + delta.seconds
+        if seconds <= 0:
+            return start
+        return start + timedelta(seconds=int(seconds * self.rng.random() ** 3))
+
+    def random_amount(self):
+        # Most donations are a few dollars, a few are much larger
+        amount = min(self.rng.lognormvariate(1.8, 0.9), 999.99)
+        return Decimal('%0.2f' % max(amount, 1))
+
+    def generate_donations(self, apps, counts):
+        """
+        Writes the donations and returns the per-day totals of the finished
+        ones as {app id: {date: [amount, count]}}.
+        """
+        totals = {}
+        for app, count in zip(apps, counts):
+            daily = totals.setdefault(app.id, {})
+            for i in range(count):
+                created = self.random_datetime(app.created_datetime)
+                amount = self.random_amount()
+                is_active = self.rng.random() >= ABANDONED_SHARE
+                pay_key = 'AP-' + ''.join([self.rng.choice(PAY_KEY_CHARS)
+                                           for j in range(17)])
+                self.writer.add(Donation(pay_key=pay_key,
+                                         application_id=app.id,
+                                         application_slug=app.slug,
+                                         amount=amount,
+                                         created_datetime=created,
+                                         updated_datetime=created,
+                                         is_active=is_active))
+                if is_active:
+                    total = daily.setdefault(created.date(), [0, 0])
+                    total[0] += amount
+                    total[1] += 1
+        print 'Generated %d donations' % sum(counts)
+        return totals
+
+    def generate_updates(self, apps, counts):
+        """
+        Writes the last progress value of each day and, when
+        settings.PROGRESS_HISTORY is enabled, every update.
+        """
+        history = getattr(settings, 'PROGRESS_HISTORY', False)
+        for app, count in zip(apps, counts):
+            # Progress is a noisy walk towards (and sometimes past) the goal
+            times = sorted([self.random_datetime(app.created_datetime)
+                            for i in range(count)])
+            step = app.goal_value * 1.2 / max(count, 1)
+            value = 0.0
+            daily = {}
+            for created in times:
+                value = max(0.0, value + self.rng.uniform(-0.5, 1.5) * step)
+                daily[created.date()] = (created, round(value, 1))
+                if history:
+                    self.writer.add(ProgressUpdate(application_id=app.id,
+                                                   value=round(value, 1),
+                                                   created_datetime=created,
+                                                   updated_datetime=created,
+                                                   is_active=True))
+
+            for date, (updated, value) in sorted(daily.items()):
+                created = datetime(date.year, date.month, date.day)
+                self.writer.add(DailyProgress(
+                    id=DailyProgress.make_key(app.id, date),
+                    application_id=app.id,
+                    date=date,
+                    value=value,
+                    created_datetime=created,
+                    updated_datetime=updated,
+                    is_active=True))
+        print 'Generated %d progress updates' % sum(counts)
+
+    def write_applications(self, apps, totals):
+        for app in apps:
+            daily = totals.get(app.id, {})
+            for date, (amount, count) in sorted(daily.items()):
+                created = datetime(date.year, date.month, date.day)
+                self.writer.add(DailyDonationTotal(
+                    id=DailyDonationTotal.make_key(app.id, date),
+                    application_id=app.id,
+                    date=date,
+                    amount=amount,
+                    count=count,
+                    created_datetime=created,
+                    updated_datetime=created,
+                    is_active=True))
+            app.total_donations = sum([amount for amount, count in daily.values()])
+            self.writer.add(app)
+        print 'Wrote %d applications and their rollups' % len(apps)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from djangoappengine.db.fanout import iter_keys
+from donate.models import Application, Donation
+from google.appengine.api.datastore import Delete, Entity, Get, Put
+
+# The number of donations moved per batch of datastore calls
+BATCH_SIZE = 100
+
+def move_donations(keys):
+    """
+    Re-puts the donation entities of keys under their pay_key as the key
+    name and deletes the originals. Returns the number of donations moved.
+    """
+    entities = [e for e in Get(keys) if e is not None]
+    slugs = Application.objects.in_bulk(
+        [e['application_id'] for e in entities if e.get('application_id')])
+
+    moved = []
+    for entity in entities:
+        pay_key = entity.get('pay_key')
+        if not pay_key:
+            # Without a payKey the donation never reached PayPal and can't
+            # be keyed by one, so it's only deleted
+            continue
+        copy = Entity(entity.kind(), name=pay_key)
+        copy.update(entity)
+        del copy['pay_key']
+        if not copy.get('application_slug'):
+            app = slugs.get(entity.get('application_id'))
+            copy['application_slug'] = app and app.slug or u''
+        moved.append(copy)
+
+    Put(moved)
+    Delete([e.key() for e in entities])
+    return len(moved)
+
+class Command(BaseCommand):
+    help = 'Moves the Donation entities written before Donation.pay_key ' \
+           'became the primary key, i.e. those with numeric ids, to key ' \
+           'names holding their payKey. Queries fail on the numeric keys, ' \
+           'so rebuild_rollups runs it first. Running it again is a no-op.'
+
+    def handle(self, *args, **options):
+        # The keys are collected first, the moved entities would otherwise
+        # show up again further on in the key order
+        keys = [key for key in iter_keys(Donation._meta.db_table, {})
+                if key.id() is not None]
+
+        moved = 0
+        for start in range(0, len(keys), BATCH_SIZE):
+            moved += move_donations(keys[start:start + BATCH_SIZE])
+        print 'Moved %d of %d donations with numeric ids' % (moved, len(keys))
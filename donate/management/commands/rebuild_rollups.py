@@ -0,0 +1,18 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from donate.models import Application
+from donate import daily_progress, rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-day donation rollups, running totals and ' \
+           'per-day progress of every application (e.g. manage.py remote ' \
+           'rebuild_rollups)'
+
+    def handle(self, *args, **options):
+        # Queries over donations with numeric ids fail, so they are moved
+        # to their payKey first
+        call_command('migrate_donation_keys')
+        for app in Application.objects.all():
+            rollups.rebuild_application(app)
+            daily_progress.rebuild_application(app)
+            print 'Rebuilt rollups for %s' % app.slug
@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from djangotoolbox.fields import ListField
 from django.contrib.auth.models import User
+from datetime import datetime
 
 class CommonModel(models.Model):
     """
@@ -34,6 +36,17 @@ class Charity(CommonModel):
     # charity email address
     email = models.EmailField()
 
+def invalidate_charity_registry(sender, **kwargs):
+    """
+    Drops the cached charity registry whenever a Charity changes
+    """
+    from donate import charity_registry
+    charity_registry.invalidate()
+
+post_save.connect(invalidate_charity_registry, sender=Charity)
+post_delete.connect(invalidate_charity_registry, sender=Charity)
+
+
 class Application(CommonModel):
     """
     A model for storing a user's Application
@@ -63,6 +76,11 @@ class Application(CommonModel):
     # the list of charities supported by the application
     charities = ListField()
 
+    # running total of all completed donations. This is maintained by
+    # donate.rollups whenever a donation finishes so the goal page never
+    # has to sum the Donation kind
+    total_donations = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+
 
 class Donation(CommonModel):
     """
@@ -76,23 +94,151 @@ class Donation(CommonModel):
 
     # The PayPal payKey associated with this donation. We use
     # the payKey to lookup the appropriate donation during all
-    # PayPal transaction flows. 
-    pay_key = models.CharField(max_length=32)
+    # PayPal transaction flows. It is the key name of the entity
+    # so those lookups are strongly consistent key gets.
+    pay_key = models.CharField(max_length=32, primary_key=True)
 
     # The application owning this donation
     application = models.ForeignKey(Application)
 
+    # The slug of the owning application, denormalized so the PayPal
+    # redirect handlers can redirect to the application without
+    # fetching it
+    application_slug = models.SlugField(max_length=32)
+
     # The amount of the donation. Handles up to 999.99
     amount = models.DecimalField(max_digits=5, decimal_places=2)
 
 
+class PaymentNotification(CommonModel):
+    """
+    A pending notice that the payment of a donation may have completed,
+    either from PayPal's IPN or from the user returning to finish_donation.
+    Notifications are verified and applied in batches by
+    donate.payments.process_notifications.
+    """
+
+    # The PayPal payKey of the payment. Being the key name, repeated
+    # notifications for the same payment collapse into one entity
+    pay_key = models.CharField(max_length=32, primary_key=True)
+
+    # Where the notification came from (see donate.payments)
+    source = models.CharField(max_length=16)
+
+    # Whether the notification has been verified and applied
+    is_processed = models.BooleanField(default=False)
+
+    # The number of times we tried to verify the payment with PayPal
+    attempts = models.IntegerField(default=0)
+
+    # When the payment should be verified (again). Pending notifications are
+    # processed in this order, and each one backs off on its own
+    next_attempt_datetime = models.DateTimeField(default=datetime.utcnow)
+
+
+class DailyDonationTotal(CommonModel):
+    """
+    A per-application, per-day rollup of the completed donations. The
+    rows are updated incrementally when a donation finishes so the goal
+    charts only ever read one small row per day.
+    """
+
+    # The key name is built from the application id and the date (see
+    # make_key) so a rollup can be fetched and updated with a key get
+    id = models.CharField(max_length=64, primary_key=True)
+
+    # The application owning this rollup
+    application = models.ForeignKey(Application)
+
+    # The (UTC) day this rollup covers
+    date = models.DateField()
+
+    # The sum and number of the donations completed on that day
+    amount = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    @staticmethod
+    def make_key(app_id, date):
+        """
+        Returns the key name of the rollup for the given application id
+        and date
+        """
+        return "%d:%s" % (app_id, date.strftime("%Y%m%d"))
+
+
 class ProgressUpdate(CommonModel):
     """
     Used to track the updates to a user's goal. Each instance 
     will have a date and value associated.
+
+    Note: The charts read DailyProgress. Updates are only kept here as
+    an audit history when settings.PROGRESS_HISTORY is enabled.
     """
     # The application owning this update
     application = models.ForeignKey(Application)
 
     # the value of this update set by the owner
     value = models.FloatField()
+
+
+class DailyProgress(CommonModel):
+    """
+    The progress of an application at the end of a day. Only the last
+    value submitted on a day is charted, so every update of that day
+    overwrites the same row and the charts read one row per day.
+    """
+
+    # The key name is built from the application id and the date (see
+    # make_key) so the row of a day is upserted with a key get
+    id = models.CharField(max_length=64, primary_key=True)
+
+    # The application owning this progress
+    application = models.ForeignKey(Application)
+
+    # The (UTC) day this progress covers
+    date = models.DateField()
+
+    # the latest value of that day set by the owner
+    value = models.FloatField()
+
+    @staticmethod
+    def make_key(app_id, date):
+        """
+        Returns the key name of the progress row for the given application
+        id and date
+        """
+        return "%d:%s" % (app_id, date.strftime("%Y%m%d"))
+
+
+class LeaderboardEntry(CommonModel):
+    """
+    One ranked application of a leaderboard snapshot. The snapshots are
+    rebuilt periodically by donate.leaderboard, which also keeps them in
+    memcache.
+    """
+
+    # The key name is built from the metric and the rank (see make_key) so
+    # a rebuild overwrites the previous snapshot in place
+    id = models.CharField(max_length=32, primary_key=True)
+
+    # The metric the application is ranked by (see donate.leaderboard)
+    metric = models.CharField(max_length=16)
+
+    # The one-based position of the application
+    rank = models.IntegerField()
+
+    # The ranked application, along with its slug and name so the
+    # leaderboard can be shown without fetching the applications
+    application = models.ForeignKey(Application)
+    application_slug = models.SlugField(max_length=32)
+    application_name = models.CharField(max_length=32)
+
+    # The value of the metric for the application
+    value = models.DecimalField(max_digits=9, decimal_places=2)
+
+    @staticmethod
+    def make_key(metric, rank):
+        """
+        Returns the key name of the entry for the given metric and rank
+        """
+        return "%s:%d" % (metric, rank)
@@ -0,0 +1,113 @@
+"""
+A memcache-backed page cache for the public goal pages. Each application
+has a generation counter that is bumped whenever something shown on its
+page changes, and cached pages are only served while their generation
+matches the current one. Serving a cached page costs a single get_many.
+"""
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from functools import wraps
+import time
+
+# How long a rendered page is kept around. Pages are invalidated through
+# their generation counter, so this only bounds the memory they use
+PAGE_TIMEOUT = 60 * 60 * 24
+
+# Stand-in for the visitor's CSRF token in the cached page. The donate form
+# on the goal page needs a per-visitor token, so it's put back on every hit
+CSRF_PLACEHOLDER = "__csrf_token_placeholder__"
+
+GENERATION_KEY = "goal_generation:%s"
+PAGE_KEY = "goal_page:%s:%s:%s:%s"
+FRAGMENT_KEY = "goal_fragment:%s:%s"
+
+def _new_generation():
+    # Start from the current time rather than 0 so a counter that was evicted
+    # from memcache can't come back with the generation of a stale page
+    return int(time.time() * 1000)
+
+def bump_generation(slug):
+    """
+    Invalidates the cached pages of the application with the given slug
+    """
+    key = GENERATION_KEY % slug
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_generation())
+
+def cache_fragment(slug, name, render):
+    """
+    Returns the content rendered by render() for the application with the
+    given slug, e.g. its badge. Like pages, fragments are cached until the
+    application's generation is bumped.
+    """
+    generation_key = GENERATION_KEY % slug
+    fragment_key = FRAGMENT_KEY % (slug, name)
+    cached = cache.get_many([generation_key, fragment_key])
+
+    generation = cached.get(generation_key)
+    if generation is None:
+        generation = _new_generation()
+        cache.add(generation_key, generation)
+
+    fragment = cached.get(fragment_key)
+    if fragment is not None and fragment[0] == generation:
+        return fragment[1]
+
+    content = render()
+    cache.set(fragment_key, (generation, content), PAGE_TIMEOUT)
+    return content
+
+def is_cacheable(request):
+    """
+    Only anonymous GET requests without pending messages share a page.
+    Everybody else sees user specific content.
+    """
+    return (request.method == "GET" and
+            not request.user.is_authenticated() and
+            not len(messages.get_messages(request)))
+
+def cache_goal_page(view):
+    """
+    Decorator for view_application that serves the page from memcache while
+    the application's generation hasn't changed.
+    """
+    @wraps(view)
+    def _view(request, slug=None):
+        if not is_cacheable(request):
+            return view(request, slug=slug)
+
+        generation_key = GENERATION_KEY % slug
+        # The embed snippet on the page holds absolute URLs, so pages are
+        # cached per scheme and host (e.g. appspot.com or a custom domain)
+        origin = "%s://%s" % (request.is_secure() and "https" or "http",
+                              request.get_host())
+        page_key = PAGE_KEY % (slug, origin, request.GET.get("granularity", ""),
+                               request.GET.get("interactive", ""))
+        cached = cache.get_many([generation_key, page_key])
+
+        generation = cached.get(generation_key)
+        if generation is None:
+            generation = _new_generation()
+            cache.add(generation_key, generation)
+
+        page = cached.get(page_key)
+        if page is not None and page[0] == generation:
+            content, content_type = page[1:]
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request) or "")
+            return HttpResponse(content, content_type=content_type)
+
+        # The generation was read before rendering, so a page rendered from
+        # data that changes in the meantime is stored under the old
+        # generation and never served
+        response = view(request, slug=slug)
+        token = get_token(request)
+        if response.status_code == 200 and token:
+            content = response.content.replace(token, CSRF_PLACEHOLDER)
+            cache.set(page_key, (generation, content, response["Content-Type"]),
+                      PAGE_TIMEOUT)
+        return response
+    return _view
@@ -0,0 +1,146 @@
+"""
+Asynchronous payment completion. PayPal's IPN and the finish_donation
+redirect only record a PaymentNotification and schedule a batch. The batch
+runs on the task queue (through the deferred handler), verifies the
+payments with PayPal's PaymentDetails operation in parallel and activates
+the completed donations, so bursts of completions stay off user-facing
+requests.
+"""
+from donate.models import Donation, PaymentNotification
+from datetime import datetime, timedelta
+from google.appengine.api import taskqueue
+from google.appengine.ext import db, deferred
+import logging
+import time
+import pagecache
+import paypal
+import rollups
+
+# Notification sources
+SOURCE_IPN = "ipn"
+SOURCE_RETURN = "return"
+
+# Notifications arriving within the same window of seconds are processed by
+# the same batch, which runs once the window has passed
+BATCH_WINDOW = 5
+
+# The number of notifications verified per batch
+BATCH_SIZE = 25
+
+# Payments still being processed by PayPal (or that couldn't be checked)
+# are checked again after RETRY_DELAY seconds, doubling the delay after
+# every attempt up to MAX_RETRY_DELAY, at most MAX_ATTEMPTS times
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 60 * 60
+MAX_ATTEMPTS = 10
+
+# PaymentDetails statuses after which the payment won't change anymore
+FINAL_STATUSES = ("COMPLETED", "INCOMPLETE", "ERROR", "REVERSALERROR")
+
+def _schedule_batch(countdown, name=None):
+    try:
+        deferred.defer(process_notifications, _countdown=countdown, _name=name)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        # the batch for this window is already scheduled
+        pass
+
+def enqueue_notification(pay_key, source):
+    """
+    Records that the payment of pay_key may have completed and makes sure a
+    batch will pick it up. Repeated notifications for the same payKey
+    overwrite each other.
+    """
+    PaymentNotification(pay_key=pay_key, source=source,
+                        next_attempt_datetime=datetime.utcnow()).save()
+    window = int(time.time()) // BATCH_WINDOW
+    _schedule_batch(BATCH_WINDOW, "payments-%d" % window)
+
+def _activate(pay_key):
+    donation = Donation.objects.get(pk=pay_key)
+    if donation.is_active:
+        return None
+    donation.is_active = True
+    donation.created_datetime = datetime.utcnow()
+    donation.save()
+    # The rollups live in other entity groups. Enqueuing their updates in
+    # this transaction makes sure they happen exactly when it commits
+    rollups.defer_donation(donation)
+    return donation
+
+def activate_donation(pay_key):
+    """
+    Activates the donation of pay_key and folds it into the rollups.
+    Activation runs in a transaction and only the call that flips the
+    donation to active enqueues the rollup updates, so applying the same
+    payment twice is harmless. Returns whether the donation was activated.
+    """
+    try:
+        donation = db.run_in_transaction(_activate, pay_key)
+    except Donation.DoesNotExist:
+        logging.warning("No donation for payKey %s" % pay_key)
+        return False
+
+    if donation is None:
+        return False
+
+    pagecache.bump_generation(donation.application_slug)
+    return True
+
+def get_retry_delay(attempts):
+    """
+    Returns the number of seconds to wait before the next verification of
+    a payment that was checked the given number of times
+    """
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+def process_notifications():
+    """
+    Task processing a batch of the pending notifications that are due,
+    longest waiting first. The PaymentDetails requests of the whole batch
+    are sent in parallel.
+    """
+    now = datetime.utcnow()
+    notifications = list(PaymentNotification.objects.filter(
+        is_processed=False, next_attempt_datetime__lte=now)
+        .order_by('next_attempt_datetime')[:BATCH_SIZE])
+
+    rpcs = [(n, paypal.create_payment_details_request_async(n.pay_key))
+            for n in notifications]
+
+    retry = False
+    for notification, rpc in rpcs:
+        response = paypal.get_pay_response(rpc)
+        errors = paypal.get_errors(response)
+        if errors:
+            [logging.error(e) for e in errors]
+
+        status = paypal.get_payment_status(response)
+        if status == "COMPLETED":
+            activate_donation(notification.pay_key)
+
+        notification.attempts += 1
+        if status in FINAL_STATUSES or paypal.is_failure(response) or \
+                notification.attempts >= MAX_ATTEMPTS:
+            notification.is_processed = True
+        else:
+            notification.next_attempt_datetime = now + timedelta(
+                seconds=get_retry_delay(notification.attempts))
+            retry = True
+        notification.save()
+
+    # There may be more due notifications than fit in one batch. Payments
+    # PayPal is still working on are picked up by a later batch, at the
+    # latest by the sweep (see sweep_notifications)
+    if len(notifications) == BATCH_SIZE:
+        _schedule_batch(0)
+    elif retry:
+        _schedule_batch(RETRY_DELAY)
+
+def sweep_notifications():
+    """
+    Schedules a batch for the current window. Run periodically by cron, so
+    notifications due for a retry, or missed by the batch of their window
+    because the query is eventually consistent, don't wait for new traffic.
+    """
+    window = int(time.time()) // BATCH_WINDOW
+    _schedule_batch(0, "payments-%d" % window)
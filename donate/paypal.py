@@ -1,6 +1,19 @@
 import settings
 import simplejson
-from google.appengine.api.urlfetch import fetch
+import logging
+import time
+from django.core.cache import cache
+from google.appengine.api import urlfetch
+
+# Seconds during which a repeated Pay request for the same client,
+# application and amount is answered with the payKey of the first one
+PAY_REQUEST_WINDOW = 60
+
+# Placeholder stored while the first Pay request is still in flight
+PAY_REQUEST_PENDING = "pending"
+
+# Seconds between checks for the payKey of an in-flight Pay request
+PAY_REQUEST_POLL_INTERVAL = 0.1
 
 def get_paypal_headers():
     """
@@ -17,12 +30,11 @@ def get_paypal_headers():
     }
 
 
-def create_pay_request(donation_amount, charities):
+def build_pay_request(donation_amount, charities):
     """
-    Utility method to build a the PayPal Pay request for starting 
-    the transaction process. The response will contain a payKey that
-    will be used when we redirect the user to PayPal to complete the
-    transaction.
+    Utility method to build the body of a PayPal Pay request for starting
+    the transaction process. The donation amount is split among the given
+    charities.
     """
 
     # Try to split the donation amount equally amount all charities
@@ -69,9 +81,10 @@ def create_pay_request(donation_amount, charities):
 
     # Build the JSON object for the payment request. All of this is pretty
     # standard stuff and can be found in the Adaptive Payments documentation
-    json = {
+    return {
         "returnUrl": settings.RETURN_URL,
         "cancelUrl": settings.CANCEL_URL,
+        "ipnNotificationUrl": settings.IPN_URL,
         "receiverList": {
             "receiver": receiver_list
         },
@@ -81,14 +94,104 @@ def create_pay_request(donation_amount, charities):
         "requestEnvelope": {"errorLanguage": "en_US"}
     }
 
-    # Use Google's fetch method to send the pay request to PayPal. The response
-    # will contain the payKey.
-    response = fetch(settings.API_ENDPOINT+"/Pay",
-        payload=simplejson.dumps(json),
-        method="POST",
+def create_pay_request_async(donation_amount, charities, deadline=None):
+    """
+    Starts a PayPal Pay request without waiting for the response. Returns
+    the urlfetch RPC object, which should be handed to get_pay_response once
+    the caller has done its other work. The deadline defaults to
+    settings.PAYPAL_DEADLINE seconds.
+    """
+    if deadline is None:
+        deadline = settings.PAYPAL_DEADLINE
+
+    rpc = urlfetch.create_rpc(deadline=deadline)
+    urlfetch.make_fetch_call(rpc, settings.API_ENDPOINT+"/Pay",
+        payload=simplejson.dumps(build_pay_request(donation_amount, charities)),
+        method=urlfetch.POST,
         headers=get_paypal_headers())
+    return rpc
 
-    return simplejson.loads(response.content)
+def get_pay_response(rpc):
+    """
+    Waits for a Pay request started by create_pay_request_async and returns
+    the decoded response. Fetch errors (e.g. an exceeded deadline) are
+    returned as a PayPal style error response so get_errors reports them.
+    """
+    try:
+        response = rpc.get_result()
+        return simplejson.loads(response.content)
+    except (urlfetch.Error, ValueError), e:
+        logging.exception("PayPal Pay request failed")
+        return {"error": [{"message": "PayPal request failed: %s" % e}]}
+
+def create_pay_request(donation_amount, charities, deadline=None):
+    """
+    Utility method to send the PayPal Pay request for starting the
+    transaction process. The response will contain a payKey that
+    will be used when we redirect the user to PayPal to complete the
+    transaction.
+    """
+    rpc = create_pay_request_async(donation_amount, charities, deadline)
+    return get_pay_response(rpc)
+
+def create_payment_details_request_async(pay_key, deadline=None):
+    """
+    Starts a PayPal PaymentDetails request for the given payKey without
+    waiting for the response. The result is read with get_pay_response.
+    """
+    if deadline is None:
+        deadline = settings.PAYPAL_DEADLINE
+
+    rpc = urlfetch.create_rpc(deadline=deadline)
+    urlfetch.make_fetch_call(rpc, settings.API_ENDPOINT+"/PaymentDetails",
+        payload=simplejson.dumps({
+            "payKey": pay_key,
+            "requestEnvelope": {"errorLanguage": "en_US"}
+        }),
+        method=urlfetch.POST,
+        headers=get_paypal_headers())
+    return rpc
+
+def coalesce_pay_request(client_id, app_id, donation_amount):
+    """
+    Utility method to coalesce duplicate Pay requests, e.g. from double
+    clicks or browser retries. Returns a (request key, payKey) tuple. When
+    the payKey is None the caller owns the request: it must send the Pay
+    request and hand the result to finish_pay_request with the request key.
+    Otherwise the payKey of the earlier request is returned, waiting for it
+    if that request is still in flight.
+    """
+    if not client_id:
+        return None, None
+
+    key = "pay_request:%s:%s:%0.2f" % (client_id, app_id, donation_amount)
+    deadline = time.time() + settings.PAYPAL_DEADLINE
+    while True:
+        if cache.add(key, PAY_REQUEST_PENDING, PAY_REQUEST_WINDOW):
+            return key, None
+
+        value = cache.get(key)
+        if value is not None and value != PAY_REQUEST_PENDING:
+            return key, value
+
+        # Don't wait longer than the earlier request may take. We then send
+        # our own request without claiming the key
+        if time.time() > deadline:
+            return None, None
+        time.sleep(PAY_REQUEST_POLL_INTERVAL)
+
+def finish_pay_request(key, pay_key):
+    """
+    Utility method to publish the payKey of a Pay request started after
+    coalesce_pay_request. A failed request (no payKey) releases the key so
+    the next attempt sends a new request.
+    """
+    if key is None:
+        return
+    if pay_key:
+        cache.set(key, pay_key, PAY_REQUEST_WINDOW)
+    else:
+        cache.delete(key)
 
 def get_pay_key(response):
     """
@@ -96,6 +199,21 @@ def get_pay_key(response):
     """
     return response.get("payKey")
 
+def get_payment_status(response):
+    """
+    Utility method to retrieve the payment status (e.g. CREATED, COMPLETED,
+    ERROR) from a PayPal PaymentDetails response
+    """
+    return response.get("status")
+
+def is_failure(response):
+    """
+    Utility method to check whether PayPal rejected the request, e.g. for
+    an unknown payKey. Unlike failed fetches these fail again when retried.
+    """
+    ack = response.get("responseEnvelope", {}).get("ack", "")
+    return ack.startswith("Failure")
+
 def get_errors(response):
     """
     Utility method to retrieve the list of errors (if any) from a 
@@ -0,0 +1,108 @@
+"""
+Incremental donation rollups. Completed donations are folded into a
+per-application, per-day DailyDonationTotal row and into the running
+Application.total_donations value when they finish, so the goal page
+reads O(days) small rows instead of every Donation entity.
+"""
+from djangoappengine.db.utils import bulk_save
+from donate.models import Application, Donation, DailyDonationTotal
+from google.appengine.api import datastore
+from google.appengine.ext import db, deferred
+import pagecache
+
+# The kind of the entities recording which donations were added to a
+# rollup. A marker is a child of the rollup's entity, so it is written in
+# the same transaction as the rollup
+MARKER_KIND = 'donate_rollupmarker'
+
+def _mark_added(kind, id_or_name, pay_key):
+    """
+    Records that the donation of pay_key was added to the entity of the
+    given kind and id or key name. Returns False if it already was. Must
+    be run inside a transaction.
+    """
+    parent = datastore.Key.from_path(kind, id_or_name)
+    key = datastore.Key.from_path(MARKER_KIND, pay_key, parent=parent)
+    if datastore.Get([key])[0] is not None:
+        return False
+    datastore.Put(datastore.Entity(MARKER_KIND, name=pay_key, parent=parent))
+    return True
+
+def _increment_daily_total(app_id, date, pay_key, amount):
+    """
+    Adds the amount to the rollup row of the given application and day,
+    creating the row if it does not exist yet. A donation is only added
+    once, however often this runs. Must be run inside a transaction.
+    """
+    key = DailyDonationTotal.make_key(app_id, date)
+    if not _mark_added(DailyDonationTotal._meta.db_table, key, pay_key):
+        return
+    try:
+        total = DailyDonationTotal.objects.get(pk=key)
+    except DailyDonationTotal.DoesNotExist:
+        total = DailyDonationTotal(id=key, application_id=app_id, date=date)
+    total.amount += amount
+    total.count += 1
+    total.save()
+
+def _increment_application_total(app_id, pay_key, amount):
+    """
+    Adds the amount to the application's running donation total. A
+    donation is only added once, however often this runs. Must be run
+    inside a transaction.
+    """
+    if not _mark_added(Application._meta.db_table, app_id, pay_key):
+        return
+    app = Application.objects.get(pk=app_id)
+    app.total_donations += amount
+    app.save()
+
+def _add_donation(app_id, slug, date, pay_key, amount):
+    # The application is updated last, so its updated_datetime covers the
+    # day's row as well (see series.get_last_modified)
+    db.run_in_transaction(_increment_daily_total, app_id, date, pay_key, amount)
+    db.run_in_transaction(_increment_application_total, app_id, pay_key, amount)
+    pagecache.bump_generation(slug)
+
+def defer_donation(donation):
+    """
+    Folds a newly completed donation into the rollups by enqueuing their
+    updates as a task, since the rollup row and the application live in
+    other entity groups than the donation. Called inside the transaction
+    activating the donation, the task is only enqueued if the activation
+    commits, and then runs until it succeeds. The task can run more than
+    once, but the updates record the payKey of the donations they added.
+    """
+    deferred.defer(_add_donation, donation.application_id,
+                   donation.application_slug, donation.created_datetime.date(),
+                   donation.pay_key, donation.amount, _transactional=True)
+
+def get_daily_totals(app):
+    """
+    Returns the rollup rows of an application ordered by date
+    """
+    return DailyDonationTotal.objects.filter(application=app).order_by('date')
+
+def rebuild_application(app):
+    """
+    Recomputes the rollups of an application from its active donations.
+    This is only needed for data that was written without going through
+    defer_donation (e.g. the bootstrap view or data predating rollups).
+    """
+    DailyDonationTotal.objects.filter(application=app).delete()
+
+    totals = {}
+    for donation in Donation.objects.filter(application=app, is_active=True):
+        date = donation.created_datetime.date()
+        amount, count = totals.get(date, (0, 0))
+        totals[date] = (amount + donation.amount, count + 1)
+
+    bulk_save([DailyDonationTotal(id=DailyDonationTotal.make_key(app.id, date),
+                                  application=app,
+                                  date=date,
+                                  amount=amount,
+                                  count=count)
+               for date, (amount, count) in totals.items()])
+
+    app.total_donations = sum([amount for amount, count in totals.values()])
+    app.save()
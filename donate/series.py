@@ -0,0 +1,97 @@
+"""
+The donation and progress series shown on the goal charts, along with the
+version information used to answer conditional requests for them.
+"""
+from datetime import datetime
+from django.utils.hashcompat import md5_constructor
+import binning
+import daily_progress
+import downsample
+import rollups
+import settings
+
+# Requests can't ask for fewer points than this
+MIN_POINTS = 3
+
+def get_granularity(app, granularity=None, now=None):
+    """
+    Returns the given granularity if it's valid, otherwise the finest one
+    that keeps the application's series short enough to chart.
+    """
+    if granularity in binning.GRANULARITIES:
+        return granularity
+    return binning.choose_granularity(app.created_datetime,
+                                      now or datetime.utcnow())
+
+def get_max_points(points=None):
+    """
+    Returns the number of points the series are downsampled to. A requested
+    number is honored between MIN_POINTS and settings.CHART_MAX_POINTS.
+    """
+    max_points = settings.CHART_MAX_POINTS
+    try:
+        return max(MIN_POINTS, min(int(points), max_points))
+    except (TypeError, ValueError):
+        return max_points
+
+def get_latest_update(app):
+    """
+    Returns the latest DailyProgress of an application or None
+    """
+    return daily_progress.get_latest_progress(app)
+
+def get_last_modified(app, now=None):
+    """
+    Returns the time the application's series last changed. Finishing a
+    donation updates the application's running total after the day's
+    rollup row (see rollups.defer_donation), so the application's
+    updated_datetime covers donations and we only need to look at the latest
+    progress update. The series also grow by a bucket every day, so they are
+    never older than the start of the current day.
+    """
+    now = now or datetime.utcnow()
+    last_modified = max(app.updated_datetime,
+                        datetime(now.year, now.month, now.day))
+    update = get_latest_update(app)
+    if update is not None:
+        last_modified = max(last_modified, update.updated_datetime)
+    return last_modified
+
+def get_etag(app, granularity, max_points, last_modified):
+    """
+    Returns the ETag of the application's series for the given granularity,
+    number of points and last modification time.
+    """
+    version = "%d:%s:%d:%s" % (app.id, granularity, max_points,
+                               last_modified.isoformat())
+    return md5_constructor(version).hexdigest()
+
+def build_series(app, granularity, max_points=None, now=None):
+    """
+    Bins the donation rollups and progress updates of an application into
+    the lists of points drawn by the charts, downsampled to at most
+    max_points points each.
+    """
+    max_points = max_points or get_max_points()
+    start_date = app.created_datetime
+    end_date = now or datetime.utcnow()
+
+    # The x-value will be the zero-based bucket index and the y-value is the
+    # total donations for that bucket
+    daily_totals = rollups.get_daily_totals(app)
+    donations = binning.bin_sum(start_date, end_date,
+        [(t.date, float(t.amount)) for t in daily_totals], granularity)
+
+    # We aren't taking a sum of the updates for a given bucket, but rather
+    # the last value for a given bucket. The user can provide as many
+    # updates as they want during the day, but only the last one on any
+    # given day is stored
+    rows = daily_progress.get_daily_progress(app)
+    updates = binning.bin_last(start_date, end_date,
+        [(p.date, p.value) for p in rows], granularity)
+
+    return {
+        "granularity": granularity,
+        "donations": downsample.sum_buckets(donations, max_points),
+        "updates": downsample.lttb(updates, max_points),
+    }
@@ -0,0 +1,102 @@
+"""
+Slug to application resolution. Goal pages are addressed by slug, and a
+slug query needs an index scan, so the slug -> application id mapping is
+cached in a per-instance LRU and in memcache and the application itself is
+fetched with a key get. Slugs can't change once an application is created,
+so the mapping only goes stale when an application is deleted:
+delete_application invalidates it and a key get that misses falls back to
+the query.
+"""
+from donate.models import Application
+from django.core.cache import cache
+
+CACHE_KEY = "slug:%s"
+
+# The number of slugs kept per instance
+LOCAL_SIZE = 1000
+
+class LRUCache(object):
+    """
+    A small least recently used cache. When it's full, the least recently
+    used half of the entries is dropped at once so evictions stay cheap.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.values = {}
+        self.used = {}
+        self.tick = 0
+
+    def get(self, key, default=None):
+        if key not in self.values:
+            return default
+        self.tick += 1
+        self.used[key] = self.tick
+        return self.values[key]
+
+    def set(self, key, value):
+        if key not in self.values and len(self.values) >= self.size:
+            recent = sorted(self.used, key=self.used.get)[len(self.used) // 2:]
+            self.values = dict((k, self.values[k]) for k in recent)
+            self.used = dict((k, self.used[k]) for k in recent)
+        self.tick += 1
+        self.values[key] = value
+        self.used[key] = self.tick
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        self.used.pop(key, None)
+
+_local = LRUCache(LOCAL_SIZE)
+
+def _remember(slug, app_id):
+    _local.set(slug, app_id)
+    cache.set(CACHE_KEY % slug, app_id)
+
+def resolve(slug):
+    """
+    Returns the id of the application with the given slug or None. Unknown
+    slugs aren't cached since the application may be created later on.
+    """
+    app_id = _local.get(slug)
+    if app_id is not None:
+        return app_id
+
+    app_id = cache.get(CACHE_KEY % slug)
+    if app_id is None:
+        try:
+            app_id = Application.objects.values_list('id', flat=True) \
+                                        .get(slug=slug)
+        except Application.DoesNotExist:
+            return None
+        cache.set(CACHE_KEY % slug, app_id)
+    _local.set(slug, app_id)
+    return app_id
+
+def get_application(slug):
+    """
+    Returns the application with the given slug. Raises
+    Application.DoesNotExist if there is none.
+    """
+    app_id = resolve(slug)
+    if app_id is None:
+        raise Application.DoesNotExist("No application with slug %s" % slug)
+    try:
+        return Application.objects.get(pk=app_id)
+    except Application.DoesNotExist:
+        # the application was deleted, and possibly created again with
+        # the same name, since the id was cached
+        invalidate(slug)
+        app = Application.objects.get(slug=slug)
+        _remember(slug, app.id)
+        return app
+
+def invalidate(slug):
+    """
+    Drops the cached id of a slug
+    """
+    _local.delete(slug)
+    cache.delete(CACHE_KEY % slug)
@@ -0,0 +1,113 @@
+"""
+Server-side rendering of the goal charts to static SVG. The bar charts are
+drawn from the same binned and downsampled series as application_series,
+with the look of the Protovis charts, so goal pages don't need to load
+Protovis unless the visitor asks for the interactive charts.
+"""
+from django.template.loader import render_to_string
+import math
+
+TEMPLATE_CHART = "svg_chart.svg"
+
+# Chart types, and which series of donate.series.build_series they draw
+PROGRESS = "progress"
+DONATIONS = "donations"
+SERIES = {
+    PROGRESS: "updates",
+    DONATIONS: "donations",
+}
+
+# Plot size and margins, in pixels
+WIDTH = 400
+HEIGHT = 200
+MARGIN_LEFT = 30
+MARGIN_RIGHT = 10
+MARGIN_TOP = 5
+MARGIN_BOTTOM = 20
+
+MAX_BAR_WIDTH = 20
+Y_TICKS = 5
+MAX_X_LABELS = 8
+
+def nice_step(max_y, ticks=Y_TICKS):
+    """
+    Returns a round step (1, 2 or 5 times a power of ten) splitting 0..max_y
+    into about the given number of ticks.
+    """
+    if max_y <= 0:
+        return 1
+    raw = float(max_y) / ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+def _format_tick(value):
+    if value == int(value):
+        return "%d" % value
+    return "%g" % value
+
+def layout(points, max_y):
+    """
+    Returns the template context of a bar chart of points scaled to max_y
+    """
+    size = len(points)
+    slot = float(WIDTH) / max(size, 1)
+    bar_width = min(MAX_BAR_WIDTH, max(slot * 0.8, 1))
+    scale = max_y and float(HEIGHT) / max_y or 0
+
+    bars = []
+    labels = []
+    label_every = max(1, int(math.ceil(float(size) / MAX_X_LABELS)))
+    for n, point in enumerate(points):
+        height = min(point["y"] * scale, HEIGHT)
+        left = n * slot + (slot - bar_width) / 2
+        bars.append({
+            "x": "%.1f" % left,
+            "y": "%.1f" % (HEIGHT - height),
+            "width": "%.1f" % bar_width,
+            "height": "%.1f" % height,
+        })
+        if n % label_every == 0:
+            month, day = point["date_string"].split("/")[:2]
+            labels.append({
+                "x": "%.1f" % (left + bar_width / 2),
+                "text": "%s/%s" % (month, day),
+            })
+
+    step = nice_step(max_y)
+    ticks = []
+    value = 0
+    while value <= max_y:
+        ticks.append({
+            "y": "%.1f" % (HEIGHT - value * scale),
+            "text": _format_tick(value),
+        })
+        value += step
+
+    return {
+        "width": WIDTH + MARGIN_LEFT + MARGIN_RIGHT,
+        "height": HEIGHT + MARGIN_TOP + MARGIN_BOTTOM,
+        "plot_width": WIDTH,
+        "plot_height": HEIGHT,
+        "margin_left": MARGIN_LEFT,
+        "margin_top": MARGIN_TOP,
+        "bars": bars,
+        "labels": labels,
+        "ticks": ticks,
+    }
+
+def render_chart(app, chart, series):
+    """
+    Renders one of the charts of an application to SVG from the series
+    built by donate.series.build_series.
+    """
+    points = series[SERIES[chart]]
+    max_y = max([p["y"] for p in points] or [0])
+    if chart == PROGRESS:
+        # like the Protovis chart, the goal is always visible
+        max_y = max(max_y, app.goal_value)
+    else:
+        max_y += 10
+    return render_to_string(TEMPLATE_CHART, layout(points, max_y))
@@ -0,0 +1,66 @@
+from django import template
+from django.utils.html import escape
+from donate import assets
+
+register = template.Library()
+
+class StaticAssetNode(template.Node):
+    def __init__(self, name, markup):
+        self.name = template.Variable(name)
+        self.markup = markup
+
+    def render(self, context):
+        urls = assets.get_urls(self.name.resolve(context))
+        return "\n".join([self.markup % escape(url) for url in urls])
+
+def _parse(token, markup):
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError("%r takes the name of an asset"
+                                           % bits[0])
+    return StaticAssetNode(bits[1], markup)
+
+@register.tag
+def static_url(parser, token):
+    """
+    Outputs the URL of a static file, using its hashed name once the assets
+    are built with "manage.py build_static".
+
+    Usage::
+
+        {% static_url "images/bg.png" %}
+    """
+    return _parse(token, "%s")
+
+@register.tag
+def static_css(parser, token):
+    """
+    Outputs the <link> tag of a stylesheet or stylesheet bundle. Until the
+    assets are built, a bundle is linked file by file.
+
+    Usage::
+
+        {% static_css "css/site.css" %}
+    """
+    return _parse(token,
+        '<link rel="stylesheet" href="%s" type="text/css" media="screen, projection">')
+
+@register.tag
+def static_print_css(parser, token):
+    """
+    Like static_css, for print stylesheets
+    """
+    return _parse(token,
+        '<link rel="stylesheet" href="%s" type="text/css" media="print">')
+
+@register.tag
+def static_js(parser, token):
+    """
+    Outputs the <script> tag of a script or script bundle. Until the assets
+    are built, a bundle is loaded file by file.
+
+    Usage::
+
+        {% static_js "js/site.js" %}
+    """
+    return _parse(token, '<script type="text/javascript" src="%s"></script>')
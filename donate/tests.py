@@ -6,6 +6,20 @@ Replace these with more appropriate tests for your application.
 """
 
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from donate.models import Application, Charity, Donation, \
+    DailyDonationTotal, DailyProgress, PaymentNotification, ProgressUpdate
+from donate import assets, binning, charity_registry, daily_progress, \
+    downsample, export, leaderboard, pagecache, payments, paypal, rollups, \
+    series, slugs, svgcharts, warmup
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from google.appengine.api import apiproxy_stub_map, datastore
+from google.appengine.ext import db, deferred
+import base64
+import settings
+import simplejson
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,10 +28,593 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+def run_deferred_tasks(queue="default", times=1):
+    """
+    Runs the deferred tasks waiting in the task queue stub, each one the
+    given number of times like the task queue may do
+    """
+    stub = apiproxy_stub_map.apiproxy.GetStub("taskqueue")
+    tasks = stub.GetTasks(queue)
+    stub.FlushQueue(queue)
+    for task in tasks:
+        for i in range(times):
+            deferred.run(base64.b64decode(task["body"]))
+
+def create_application(name="Test Goal", user=None):
+    if user is None:
+        user = User.objects.create_user(username="owner@example.com",
+                                        email="owner@example.com",
+                                        password="password")
+    return Application.objects.create(user=user,
+                                      name=name,
+                                      slug=name.replace(" ", "-").lower(),
+                                      description="A test goal",
+                                      goal_value=10,
+                                      goal_units_singular="pound",
+                                      goal_units_plural="pounds",
+                                      charities=[])
+
+class RollupTest(TestCase):
+    def setUp(self):
+        self.app = create_application()
+
+    def donate(self, amount, created_datetime):
+        donation = Donation.objects.create(pay_key="AP-%s" % amount,
+                                           application=self.app,
+                                           application_slug=self.app.slug,
+                                           amount=amount)
+        donation.created_datetime = created_datetime
+        donation.save()
+        return donation
+
+    def record(self, donation):
+        # like payments.activate_donation the updates are enqueued by a
+        # transaction on the donation
+        def enqueue():
+            rollups.defer_donation(Donation.objects.get(pk=donation.pk))
+        db.run_in_transaction(enqueue)
+
+    def test_defer_donation(self):
+        self.record(self.donate(Decimal("5.00"), datetime(2011, 3, 1, 8)))
+        self.record(self.donate(Decimal("2.50"), datetime(2011, 3, 1, 20)))
+        self.record(self.donate(Decimal("1.00"), datetime(2011, 3, 3)))
+        run_deferred_tasks()
+
+        totals = list(rollups.get_daily_totals(self.app))
+        self.assertEquals([(t.date.day, t.amount, t.count) for t in totals],
+                          [(1, Decimal("7.50"), 2), (3, Decimal("1.00"), 1)])
+        app = Application.objects.get(pk=self.app.pk)
+        self.assertEquals(app.total_donations, Decimal("8.50"))
+
+    def test_tasks_run_twice(self):
+        self.record(self.donate(Decimal("5.00"), datetime(2011, 3, 1)))
+        run_deferred_tasks(times=2)
+
+        totals = list(rollups.get_daily_totals(self.app))
+        self.assertEquals([(t.amount, t.count) for t in totals],
+                          [(Decimal("5.00"), 1)])
+        app = Application.objects.get(pk=self.app.pk)
+        self.assertEquals(app.total_donations, Decimal("5.00"))
+
+    def test_rebuild_application(self):
+        self.donate(Decimal("5.00"), datetime(2011, 3, 1))
+        self.donate(Decimal("3.00"), datetime(2011, 3, 2))
+        rollups.rebuild_application(self.app)
+        rollups.rebuild_application(self.app)
+
+        self.assertEquals(DailyDonationTotal.objects.count(), 2)
+        app = Application.objects.get(pk=self.app.pk)
+        self.assertEquals(app.total_donations, Decimal("8.00"))
+
+class PaymentsTest(TestCase):
+    def test_activate_donation_once(self):
+        app = create_application()
+        Donation.objects.create(pay_key="AP-ACTIVATE",
+                                application=app,
+                                application_slug=app.slug,
+                                amount=Decimal("4.00"),
+                                is_active=False)
+
+        self.assertTrue(payments.activate_donation("AP-ACTIVATE"))
+        self.assertFalse(payments.activate_donation("AP-ACTIVATE"))
+        self.assertFalse(payments.activate_donation("AP-UNKNOWN"))
+
+        # the rollups are updated by the tasks enqueued with the activation
+        app = Application.objects.get(pk=app.pk)
+        self.assertEquals(app.total_donations, Decimal("0"))
+        run_deferred_tasks()
+
+        self.assertTrue(Donation.objects.get(pk="AP-ACTIVATE").is_active)
+        app = Application.objects.get(pk=app.pk)
+        self.assertEquals(app.total_donations, Decimal("4.00"))
+
+    def test_retry_delay(self):
+        self.assertEquals(payments.get_retry_delay(1), payments.RETRY_DELAY)
+        self.assertEquals(payments.get_retry_delay(3), 4 * payments.RETRY_DELAY)
+        self.assertEquals(payments.get_retry_delay(payments.MAX_ATTEMPTS),
+                          payments.MAX_RETRY_DELAY)
+
+    def test_notifications_wait_for_retry(self):
+        PaymentNotification(pay_key="AP-LATER", source=payments.SOURCE_IPN,
+                            attempts=1,
+                            next_attempt_datetime=datetime.utcnow() +
+                                                  timedelta(minutes=5)).save()
+        payments.process_notifications()
+        self.assertEquals(PaymentNotification.objects.get(pk="AP-LATER").attempts, 1)
+
+    def test_ipn_requires_adaptive_payment(self):
+        response = self.client.post("/paypal_ipn", {"pay_key": "AP-IPN",
+                                                    "status": "COMPLETED"})
+        self.assertEquals(response.status_code, 400)
+
+    def test_ipn_requires_donation(self):
+        response = self.client.post("/paypal_ipn", {
+            "pay_key": "AP-FORGED",
+            "transaction_type": "Adaptive Payment PAY",
+            "status": "COMPLETED"})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(PaymentNotification.objects.count(), 0)
+
+    def test_paypal_failure_is_final(self):
+        response = {"responseEnvelope": {"ack": "Failure"},
+                    "error": [{"message": "Invalid request"}]}
+        self.assertTrue(paypal.is_failure(response))
+        self.assertFalse(paypal.is_failure(
+            {"error": [{"message": "PayPal request failed"}]}))
+
+class MigrateDonationKeysTest(TestCase):
+    def test_move_numeric_ids(self):
+        app = create_application()
+        Donation.objects.create(pay_key="AP-OLD",
+                                application=app,
+                                application_slug=app.slug,
+                                amount=Decimal("3.00"),
+                                is_active=True)
+
+        # store it like before pay_key became the primary key
+        entity = datastore.Get(datastore.Key.from_path(
+            Donation._meta.db_table, "AP-OLD"))
+        old = datastore.Entity(Donation._meta.db_table)
+        old.update(entity)
+        old["pay_key"] = u"AP-OLD"
+        del old["application_slug"]
+        datastore.Put(old)
+        datastore.Delete(entity.key())
+
+        call_command("migrate_donation_keys")
+        call_command("migrate_donation_keys")
+
+        donation = Donation.objects.get(pk="AP-OLD")
+        self.assertEquals(donation.amount, Decimal("3.00"))
+        self.assertEquals(donation.application_slug, app.slug)
+        self.assertEquals(Donation.objects.count(), 1)
+
+class BinningTest(TestCase):
+    def test_bin_sum_orders_by_date(self):
+        points = binning.bin_sum(date(2011, 9, 28), date(2011, 10, 2),
+                                 [(date(2011, 10, 1), 2.0),
+                                  (date(2011, 9, 30), 1.0),
+                                  (date(2011, 10, 1), 3.0)])
+        self.assertEquals([p["date_string"] for p in points],
+                          ["9/28/2011", "9/29/2011", "9/30/2011",
+                           "10/1/2011", "10/2/2011"])
+        self.assertEquals([p["x"] for p in points], range(5))
+        self.assertEquals([p["y"] for p in points], [0, 0, 1.0, 5.0, 0])
+
+    def test_bin_last_keeps_latest_value(self):
+        start = datetime(2011, 3, 1, 12)
+        points = binning.bin_last(start, datetime(2011, 3, 2, 9),
+                                  [(datetime(2011, 3, 1, 18), 2),
+                                   (datetime(2011, 3, 1, 23), 3),
+                                   (datetime(2011, 3, 1, 13), 1),
+                                   (datetime(2011, 3, 2, 8), 4)])
+        self.assertEquals([p["y"] for p in points], [3, 4])
+
+    def test_week_and_month_buckets(self):
+        start = date(2011, 1, 15)
+        events = [(date(2011, 1, 20), 1), (date(2011, 1, 31), 1),
+                  (date(2011, 3, 1), 1)]
+
+        points = binning.bin_sum(start, date(2011, 3, 1), events, binning.WEEK)
+        self.assertEquals(len(points), 7)
+        self.assertEquals(points[1]["date_string"], "1/22/2011")
+        self.assertEquals([p["y"] for p in points], [1, 0, 1, 0, 0, 0, 1])
+
+        points = binning.bin_sum(start, date(2011, 3, 1), events, binning.MONTH)
+        self.assertEquals([p["date_string"] for p in points],
+                          ["1/1/2011", "2/1/2011", "3/1/2011"])
+        self.assertEquals([p["y"] for p in points], [2, 0, 1])
+
+    def test_choose_granularity(self):
+        start = date(2010, 1, 1)
+        self.assertEquals(binning.choose_granularity(start, date(2010, 2, 1)),
+                          binning.DAY)
+        self.assertEquals(binning.choose_granularity(start, date(2010, 12, 1)),
+                          binning.WEEK)
+        self.assertEquals(binning.choose_granularity(start, date(2013, 1, 1)),
+                          binning.MONTH)
+
+class DownsampleTest(TestCase):
+    def points(self, values):
+        return [{"x": n, "date_string": str(n), "y": y}
+                for n, y in enumerate(values)]
+
+    def test_lttb(self):
+        values = [0] * 50 + [100] + [0] * 49
+        sampled = downsample.lttb(self.points(values), 10)
+        self.assertEquals(len(sampled), 10)
+        self.assertEquals(sampled[0]["x"], 0)
+        self.assertEquals(sampled[-1]["x"], 99)
+        # the spike is the most significant point and must survive
+        self.assertTrue(100 in [p["y"] for p in sampled])
+
+        short = self.points([1, 2, 3])
+        self.assertEquals(downsample.lttb(short, 10), short)
+
+    def test_sum_buckets(self):
+        points = self.points(range(100))
+        sampled = downsample.sum_buckets(points, 30)
+        self.assertTrue(len(sampled) <= 30)
+        self.assertEquals(sum([p["y"] for p in sampled]), sum(range(100)))
+        self.assertEquals(sampled[1]["x"], 4)
+
+    def test_max_points(self):
+        self.assertEquals(series.get_max_points(), settings.CHART_MAX_POINTS)
+        self.assertEquals(series.get_max_points("10"), 10)
+        self.assertEquals(series.get_max_points("1"), series.MIN_POINTS)
+        self.assertEquals(series.get_max_points("100000"),
+                          settings.CHART_MAX_POINTS)
+
+class SeriesTest(TestCase):
+    def setUp(self):
+        self.app = create_application()
+        self.url = "/goal/%s/series.json" % self.app.slug
+
+    def test_series(self):
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        data = simplejson.loads(response.content)
+        self.assertEquals(data["granularity"], binning.DAY)
+        self.assertEquals(len(data["donations"]), 1)
+        self.assertEquals(len(data["updates"]), 1)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+        daily_progress.record_progress(self.app, 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response["ETag"], etag)
+
+class DailyProgressTest(TestCase):
+    def setUp(self):
+        self.app = create_application()
+
+    def test_one_row_per_day(self):
+        today = datetime(2010, 11, 2, 9)
+        daily_progress.record_progress(self.app, 1, now=today)
+        daily_progress.record_progress(self.app, 3, now=today + timedelta(hours=5))
+        daily_progress.record_progress(self.app, 4, now=today + timedelta(days=1))
+
+        rows = list(daily_progress.get_daily_progress(self.app))
+        self.assertEquals([(r.date, r.value) for r in rows],
+                          [(date(2010, 11, 2), 3.0), (date(2010, 11, 3), 4.0)])
+        self.assertEquals(daily_progress.get_latest_progress(self.app).value, 4.0)
+        self.assertEquals(ProgressUpdate.objects.count(), 0)
+
+    def test_tasks_run_twice(self):
+        self.record(self.donate(Decimal("5.00"), datetime(2011, 3, 1)))
+        run_deferred_tasks(times=2)
+
+        totals = list(rollups.get_daily_totals(self.app))
+        self.assertEquals([(t.amount, t.count) for t in totals],
+                          [(Decimal("5.00"), 1)])
+        app = Application.objects.get(pk=self.app.pk)
+        self.assertEquals(app.total_donations, Decimal("5.00"))
+
+    def test_rebuild_application(self):
+        for hour, value in ((8, 2), (20, 5), (12, 3)):
+            update = ProgressUpdate(application=self.app, value=value)
+            update.save()
+            update.created_datetime = datetime(2010, 11, 2, hour)
+            update.save()
+
+        daily_progress.rebuild_application(self.app)
+        row = DailyProgress.objects.get(
+            pk=DailyProgress.make_key(self.app.id, date(2010, 11, 2)))
+        self.assertEquals(row.value, 5.0)
+
+class PageCacheTest(TestCase):
+    def test_bump_generation(self):
+        app = create_application()
+        url = "/goal/%s" % app.slug
+        self.assertEquals(self.client.get(url).status_code, 200)
+
+        # the update isn't visible until the generation is bumped
+        daily_progress.record_progress(app, 42.5)
+        self.assertFalse("42.5" in self.client.get(url).content)
+
+        pagecache.bump_generation(app.slug)
+        self.assertTrue("42.5" in self.client.get(url).content)
+
+    def test_csrf_token_is_per_visitor(self):
+        app = create_application()
+        url = "/goal/%s" % app.slug
+        self.client.get(url)
+        content = self.client.get(url).content
+        self.assertFalse(pagecache.CSRF_PLACEHOLDER in content)
+        self.assertTrue(self.client.cookies["csrftoken"].value in content)
+
+    def test_embed_urls_are_per_host(self):
+        app = create_application()
+        url = "/goal/%s" % app.slug
+        self.client.get(url, HTTP_HOST="example.appspot.com")
+        content = self.client.get(url, HTTP_HOST="goals.example.com").content
+        self.assertTrue("http://goals.example.com/" in content)
+        self.assertFalse("example.appspot.com" in content)
+
+class CharityRegistryTest(TestCase):
+    def test_invalidation(self):
+        red_cross = Charity.objects.create(name="Red Cross",
+                                           email="redcross@example.com")
+        self.assertEquals([c.name for c in charity_registry.get_all()],
+                          ["Red Cross"])
+
+        wikipedia = Charity.objects.create(name="Wikipedia",
+                                           email="wikipedia@example.com")
+        self.assertEquals(
+            [c.name for c in charity_registry.get_charities([wikipedia.pk,
+                                                             red_cross.pk])],
+            ["Wikipedia", "Red Cross"])
+
+        red_cross.delete()
+        self.assertEquals(
+            [c.name for c in charity_registry.get_charities([wikipedia.pk,
+                                                             red_cross.pk])],
+            ["Wikipedia"])
+
+class PayRequestTest(TestCase):
+    def test_split_amount(self):
+        charities = [Charity(name="Charity %d" % i,
+                             email="charity%d@example.com" % i)
+                     for i in range(3)]
+        request = paypal.build_pay_request(10.0, charities)
+        receivers = request["receiverList"]["receiver"]
+        self.assertEquals([r["amount"] for r in receivers],
+                          ["3.34", "3.33", "3.33"])
+        self.assertEquals([r["email"] for r in receivers],
+                          [c.email for c in charities])
+
+    def test_coalesce_pay_request(self):
+        key, pay_key = paypal.coalesce_pay_request("coalesce-test", 1, 5.0)
+        self.assertEquals(pay_key, None)
+        paypal.finish_pay_request(key, "AP-COALESCED")
+
+        self.assertEquals(paypal.coalesce_pay_request("coalesce-test", 1, 5.0),
+                          (key, "AP-COALESCED"))
+        self.assertEquals(paypal.coalesce_pay_request("coalesce-test", 1, 7.5)[1],
+                          None)
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.apps = [create_application("First Goal")]
+        user = self.apps[0].user
+        for name in ("Second Goal", "Third Goal"):
+            self.apps.append(create_application(name, user))
+
+    def test_rebuild(self):
+        today = date(2010, 11, 20)
+        for app, total, recent in zip(self.apps, (30, 50, 0), (20, 5, 0)):
+            app.total_donations = Decimal(total)
+            app.save()
+            DailyDonationTotal(id=DailyDonationTotal.make_key(app.id, today),
+                               application=app, date=today,
+                               amount=Decimal(recent), count=1).save()
+
+        leaderboard.aggregate_batch(today=today)
+        funded = leaderboard.get_snapshot(leaderboard.FUNDED)
+        self.assertEquals([e["slug"] for e in funded],
+                          ["second-goal", "first-goal"])
+        growing = leaderboard.get_snapshot(leaderboard.GROWING)
+        self.assertEquals([e["slug"] for e in growing],
+                          ["first-goal", "second-goal"])
+
+    def test_paging(self):
+        snapshot = [(Decimal(n), app.id, app.slug, app.name)
+                    for n, app in enumerate(self.apps * 10)]
+        old_size = leaderboard.PAGE_SIZE
+        leaderboard.PAGE_SIZE = 25
+        try:
+            leaderboard.save_snapshot(leaderboard.FUNDED, snapshot)
+            page, cursor = leaderboard.get_page(leaderboard.FUNDED)
+            self.assertEquals(len(page), 25)
+            page, cursor = leaderboard.get_page(leaderboard.FUNDED, cursor)
+            self.assertEquals(len(page), 5)
+            self.assertEquals(cursor, None)
+        finally:
+            leaderboard.PAGE_SIZE = old_size
+
+        response = self.client.get("/leaderboard", {"cursor": "%%%"})
+        self.assertEquals(response.status_code, 400)
+
+class SlugCacheTest(TestCase):
+    def test_lru_eviction(self):
+        lru = slugs.LRUCache(4)
+        for n in range(4):
+            lru.set(n, n)
+        lru.get(0)
+        lru.set(4, 4)
+        self.assertEquals(lru.get(0), 0)
+        self.assertEquals(lru.get(1), None)
+        self.assertEquals(lru.get(4), 4)
+
+    def test_resolve_and_invalidate(self):
+        app = create_application()
+        self.assertEquals(slugs.resolve(app.slug), app.id)
+        self.assertEquals(slugs.get_application(app.slug).pk, app.pk)
+
+        app.delete()
+        slugs.invalidate(app.slug)
+        self.assertEquals(slugs.resolve(app.slug), None)
+        self.assertEquals(self.client.get("/goal/%s" % app.slug).status_code, 404)
+
+    def test_stale_entry(self):
+        app = create_application()
+        slugs.resolve(app.slug)
+
+        # another instance deleted and recreated the application
+        user = app.user
+        app.delete()
+        app = create_application(user=user)
+        self.assertEquals(slugs.get_application(app.slug).pk, app.pk)
+        self.assertEquals(slugs.resolve(app.slug), app.id)
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.app = create_application()
+        for n in range(5):
+            Donation.objects.create(pay_key="AP-%d" % n,
+                                    application=self.app,
+                                    application_slug=self.app.slug,
+                                    amount=Decimal(n + 1))
+        Donation.objects.create(pay_key="AP-PENDING", application=self.app,
+                                application_slug=self.app.slug,
+                                amount=Decimal(1), is_active=False)
+        self.old_batch_size = export.BATCH_SIZE
+        export.BATCH_SIZE = 2
+
+    def tearDown(self):
+        export.BATCH_SIZE = self.old_batch_size
+
+    def test_batches(self):
+        donations = list(export.iter_donations(self.app))
+        self.assertEquals(sorted([d.pay_key for d in donations]),
+                          ["AP-%d" % n for n in range(5)])
+
+    def test_export(self):
+        url = "/applications/%d/donations.%%s" % self.app.id
+        self.client.login(username="owner@example.com", password="password")
+
+        response = self.client.get(url % "csv")
+        lines = response.content.splitlines()
+        self.assertEquals(lines[0], ",".join(export.CSV_COLUMNS))
+        self.assertEquals(len(lines), 6)
+
+        response = self.client.get(url % "json")
+        data = simplejson.loads(response.content)
+        self.assertEquals(len(data["donations"]), 5)
+
+    def test_owner_only(self):
+        User.objects.create_user(username="other@example.com",
+                                 email="other@example.com",
+                                 password="password")
+        self.client.login(username="other@example.com", password="password")
+        response = self.client.get("/applications/%d/donations.csv" % self.app.id)
+        self.assertEquals(response.status_code, 404)
+
+class BadgeTest(TestCase):
+    def test_badge(self):
+        app = create_application()
+        url = "/goal/%s/badge.svg" % app.slug
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response["Content-Type"], "image/svg+xml")
+        self.assertTrue(response["Cache-Control"].startswith("public"))
+
+        # the badge is cached until the generation is bumped
+        daily_progress.record_progress(app, 7)
+        self.assertFalse("7.0/10" in self.client.get(url).content)
+        pagecache.bump_generation(app.slug)
+        self.assertTrue("7.0/10" in self.client.get(url).content)
+
+        self.assertEquals(self.client.get("/goal/missing/badge.svg").status_code, 404)
+
+class SVGChartTest(TestCase):
+    def setUp(self):
+        self.app = create_application()
+
+    def test_nice_step(self):
+        self.assertEquals(svgcharts.nice_step(10), 2)
+        self.assertEquals(svgcharts.nice_step(90), 20)
+        self.assertEquals(svgcharts.nice_step(0), 1)
+
+    def test_chart(self):
+        daily_progress.record_progress(self.app, 4)
+        url = "/goal/%s/progress.svg" % self.app.slug
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response["Content-Type"], "image/svg+xml")
+        self.assertTrue("<rect" in response.content)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEquals(response.status_code, 304)
+
+        url = "/goal/%s/donations.svg" % self.app.slug
+        self.assertEquals(self.client.get(url).status_code, 200)
+
+    def test_page_without_protovis(self):
+        url = "/goal/%s" % self.app.slug
+        self.assertFalse("protovis" in self.client.get(url).content)
+        self.assertTrue("protovis" in self.client.get(url, {"interactive": 1}).content)
+
+class AssetsTest(TestCase):
+    def test_build(self):
+        files = {
+            "images/bg.png": "png",
+            "css/a/base.css": "body {\n  color: red; /* red */\n}\n.x { background: url(img.png); }",
+            "css/a/img.png": "img",
+            "css/style.css": "body { background: url('/static/images/bg.png'); }",
+        }
+        output, manifest = assets.build(files,
+            {"css/site.css": ("css/a/base.css", "css/style.css")})
+
+        self.assertEquals(manifest["images/bg.png"],
+                          assets.hashed_name("images/bg.png", "png"))
+        site = output[manifest["css/site.css"]]
+        self.assertTrue("body{color:red}" in site)
+        self.assertTrue("url(/static/%s)" % manifest["css/a/img.png"] in site)
+        self.assertTrue("url(/static/%s)" % manifest["images/bg.png"] in site)
+
+    def test_unbuilt_urls(self):
+        old_manifest = assets._manifest
+        assets._manifest = {}
+        try:
+            self.assertEquals(assets.get_urls("css/site.css"),
+                              ["/static/css/blueprint/screen.css",
+                               "/static/css/style.css"])
+            assets._manifest = {"css/site.css": "css/site.abc.css"}
+            self.assertEquals(assets.get_urls("css/site.css"),
+                              ["/static/css/site.abc.css"])
+        finally:
+            assets._manifest = old_manifest
+
+class WarmupTest(TestCase):
+    def test_warmup(self):
+        app = create_application()
+        leaderboard.save_snapshot(leaderboard.FUNDED,
+                                  [(Decimal(5), app.id, app.slug, app.name)])
+        slugs.invalidate(app.slug)
+
+        response = self.client.get("/_ah/warmup")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(slugs._local.get(app.slug), app.id)
+
+    def test_failing_step(self):
+        from django.conf import settings as django_settings
+        old_steps = django_settings.WARMUP_STEPS
+        django_settings.WARMUP_STEPS = ("donate.warmup.missing_step",) + old_steps
+        try:
+            self.assertEquals(self.client.get("/_ah/warmup").status_code, 200)
+        finally:
+            django_settings.WARMUP_STEPS = old_steps
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
 >>> 1 + 1 == 2
 True
 """}
-
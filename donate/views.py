@@ -1,15 +1,32 @@
 from donate.models import *
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, \
+    HttpResponseNotAllowed
+from django.core.urlresolvers import reverse
 from django.shortcuts import render_to_response, redirect, get_object_or_404
 from django.template import Context, RequestContext, Template
+from django.template.loader import render_to_string
 from django.contrib import messages, auth
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from djangotoolbox.http import JSONResponse
 from datetime import datetime, timedelta
 from random import randrange
 
 import settings
+import binning
+import charity_registry
+import daily_progress
+import export
+import leaderboard as leaderboards
+import pagecache
+import payments
 import paypal
+import rollups
+import series
+import slugs
+import svgcharts
 import re
 import simplejson
 
@@ -26,6 +43,11 @@ TEMPLATE_ACCOUNT = "account.html"
 TEMPLATE_CREATE_EDIT_APPLICATION = "create_edit_application.html"
 TEMPLATE_VIEW_APPLICATION = "view_application.html"
 TEMPLATE_CONFIRM_DONATION = "confirm_donation.html"
+TEMPLATE_LEADERBOARD = "leaderboard.html"
+TEMPLATE_BADGE = "badge.svg"
+
+# How long browsers and Google's edge cache may keep a badge, in seconds
+BADGE_MAX_AGE = 300
 
 
 VALID_APPLICATION_NAME_PATTERN = re.compile("^[a-zA-Z0-9 ]*$")
@@ -67,6 +89,15 @@ def create_random_datetime(start, end):
     random_second = randrange(int_delta)
     return (start + timedelta(seconds=random_second))
 
+def get_application_or_404(slug):
+    """
+    Returns the application with the given slug or raises Http404. The
+    slug is resolved through the slug cache so this is a key get.
+    """
+    try:
+        return slugs.get_application(slug)
+    except Application.DoesNotExist:
+        raise Http404("No application with slug %s" % slug)
 
 ##
 # View methods
@@ -187,9 +218,9 @@ def update_progress(request):
         messages.error(request, "Progress must be a number.")
         return redirect(view_application, slug=app.slug)
 
-    # Create the progress udpate and save it
-    pu = ProgressUpdate(application=app, value=progress)
-    pu.save()
+    # Store the progress as the value of the current day
+    daily_progress.record_progress(app, progress)
+    pagecache.bump_generation(app.slug)
 
     # return back to the application with a thank you message
     messages.success(request, "Progress udpated.")
@@ -233,37 +264,60 @@ def donate(request):
         return redirect(view_application, slug=app.slug)
 
     # get the list of charities supporting this application
-    supporting_charities = Charity.objects.filter(pk__in=app.charities)
+    supporting_charities = charity_registry.get_charities(app.charities)
 
-    # begin the payment process by sending a Pay API request to
-    # PayPal to obtain a payKey that will be used when redirecting
-    # to PayPal for completing the transaction
-    response = paypal.create_pay_request(float(donation_amount), supporting_charities)
-    
-    errors = paypal.get_errors(response)
-    if errors:
-        [logging.error(e) for e in errors]
-
-    # Execute the Pay request
-    pay_key = paypal.get_pay_key(response)
-
-    # if we have a valid payKey we can create an inactive Donation object using
-    # the payKey as a lookup field for after the transaction has been complete
-    # and PayPal has redirected back to our site
-    if pay_key:
-        d = Donation(pay_key=pay_key, 
-                     application=app, 
+    context = {
+        "application": app,
+        "donation_amount": donation_amount,
+        "supporting_charities": supporting_charities
+    }
+
+    # Double clicks and browser retries post the same donation more than
+    # once. If this browser recently started a Pay request for the same
+    # application and amount we hand back its payKey (and thereby its
+    # Donation) instead of starting another one
+    request_key, pay_key = paypal.coalesce_pay_request(
+        request.META.get("CSRF_COOKIE"), app.id, float(donation_amount))
+
+    if pay_key is None:
+        # begin the payment process by sending a Pay API request to
+        # PayPal to obtain a payKey that will be used when redirecting
+        # to PayPal for completing the transaction. The request runs in
+        # the background while we prepare the Donation
+        rpc = paypal.create_pay_request_async(float(donation_amount), supporting_charities)
+
+        # build the inactive Donation object. It is only saved once we have
+        # the payKey since that's the lookup field for after the transaction
+        # has been complete and PayPal has redirected back to our site
+        d = Donation(application=app,
+                     application_slug=app.slug,
                      amount=donation_amount,
                      is_active=False)
-        d.save()
+
+        # The page shows the signed in user, whose session and User entity
+        # come from memcache and the datastore. Load them while PayPal works
+        # on the Pay request rather than after it, while rendering
+        request.user.is_authenticated()
+
+        # Wait for the Pay request
+        response = paypal.get_pay_response(rpc)
+
+        errors = paypal.get_errors(response)
+        if errors:
+            [logging.error(e) for e in errors]
+
+        # if we have a valid payKey we can save the inactive Donation object
+        pay_key = paypal.get_pay_key(response)
+        if pay_key:
+            d.pay_key = pay_key
+            d.save()
+
+        # let retries of this donation reuse the payKey
+        paypal.finish_pay_request(request_key, pay_key)
 
     # Render the template with the required context information
-    return render(request, TEMPLATE_CONFIRM_DONATION, {
-        "pay_key": pay_key,
-        "application": app,
-        "donation_amount": donation_amount,
-        "supporting_charities": supporting_charities
-    })
+    context["pay_key"] = pay_key
+    return render(request, TEMPLATE_CONFIRM_DONATION, context)
 
 def cancel_donation(request):
     """
@@ -279,9 +333,9 @@ def cancel_donation(request):
 
     try:
         # get the payKey and redirect to the associated application
-        pay_key = request.GET.get("payKey")
-        donation = Donation.objects.get(pay_key=pay_key)
-        return redirect(view_application, slug=donation.application.slug)
+        pay_key = request.GET.get("payKey", "")
+        donation = Donation.objects.get(pk=pay_key)
+        return redirect(view_application, slug=donation.application_slug)
     except Donation.DoesNotExist:
         # Do nothing. Maybe log it.
         pass
@@ -291,131 +345,219 @@ def cancel_donation(request):
 def finish_donation(request):
     """
     A donation was successfull. Look up the donation object via the payKey
-    query string parameter and set the donation object to be active. Then
-    we redirect back to the application.
+    query string parameter and queue the payment for verification. The
+    donation becomes active once the payment has been verified with PayPal
+    (see donate.payments). Then we redirect back to the application.
     """
 
     messages.success(request, "Your donation was successful! Thank you very much!")
 
     try:
         # get the payKey from the query string
-        pay_key = request.GET.get("payKey")
-
-        # look up the donation that matches that payKey and update the created
-        # datetime as well as the is_active field
-        donation = Donation.objects.get(pay_key=pay_key)
-        donation.is_active = True
-        donation.created_datetime = datetime.utcnow()
-        donation.save()
-        return redirect(view_application, slug=donation.application.slug)
+        pay_key = request.GET.get("payKey", "")
+
+        # look up the donation that matches that payKey. PayPal may redirect
+        # here more than once for the same payKey (e.g. a browser refresh)
+        # so we only queue donations that aren't active yet
+        donation = Donation.objects.get(pk=pay_key)
+        if not donation.is_active:
+            payments.enqueue_notification(pay_key, payments.SOURCE_RETURN)
+
+        return redirect(view_application, slug=donation.application_slug)
     except Donation.DoesNotExist:
         # Do nothing. Maybe log it.
         pass
 
     return redirect(index)
 
+@csrf_exempt
+def paypal_ipn(request):
+    """
+    Receives PayPal's Instant Payment Notifications. We only check that the
+    notification is about an Adaptive Payments payment of a donation that
+    isn't active yet and queue it; the payment status is verified with
+    PayPal before the donation is activated.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    pay_key = request.POST.get("pay_key", "")
+    transaction_type = request.POST.get("transaction_type", "")
+    if not pay_key or not transaction_type.startswith("Adaptive Payment"):
+        return HttpResponseBadRequest("Not an Adaptive Payments notification")
+
+    if request.POST.get("status") == "COMPLETED":
+        # Anyone can post here, so only payKeys of our own donations make
+        # it to PayPal
+        try:
+            donation = Donation.objects.get(pk=pay_key)
+            if not donation.is_active:
+                payments.enqueue_notification(pay_key, payments.SOURCE_IPN)
+        except Donation.DoesNotExist:
+            logging.warning("IPN for unknown payKey %s" % pay_key)
+
+    return HttpResponse("OK", mimetype="text/plain")
+
+@pagecache.cache_goal_page
 def view_application(request, slug=None):
     """
     View method to view the application matching the given slug.
     """
 
     # grab the application or throw a 404
-    app = get_object_or_404(Application, slug=slug)
+    app = get_application_or_404(slug)
 
-    # now
-    now = datetime.utcnow()
-
-    # get the donations
-    donations = app.donation_set.filter(is_active=True).order_by('-created_datetime')
-
-    # sum of the donations
-    total_donations = sum([d.amount for d in donations])
-
-    # application start time and today's date. Used to iterate over the days to
-    # group donations and updates to the application for charting
-    start_date = app.created_datetime
-    end_date = datetime.utcnow()
-
-    # Build up a data structure that will bin date strings to the donation
-    # amount for that date. The x-value will be the zero-based day index and
-    # the y-value is the total donations for that date
-    bins = {}
-    for n in range((end_date-start_date).days+1):
-        date = start_date + timedelta(days=n)
-        date_string = "%d/%d/%d" % (date.month, date.day, date.year)
-        bins[date_string] = {"x": n, "date_string": date_string, "y": 0}
-
-    for donation in donations:
-        date_string = "%d/%d/%d" % (
-            donation.created_datetime.month,
-            donation.created_datetime.day,
-            donation.created_datetime.year,
-        )
-        bins[date_string]["y"] += float(donation.amount)
-
-    # we have them in day bins, now put them into a json list sorted by date
-    sorted_keys = sorted(bins.keys())
-    goal_donations = simplejson.dumps([bins[k] for k in sorted_keys])
-
-    # now we're essentially going to do the same thing for updates. The major
-    # difference is that we aren't taking a sum of the updates for a given day, but
-    # rather we'll take the last value for a given day. That way the user can provide
-    # as many updates as they want during the day, but ultimately the last one on any
-    # given day gets used
-
-    # get the updates for this application
-    updates = app.progressupdate_set.all().order_by('-created_datetime')
+    # the running total maintained by finish_donation
+    total_donations = app.total_donations
 
     # the currently used application update
-    if updates:
-        current_value = updates[0].value
+    update = series.get_latest_update(app)
+    if update is not None:
+        current_value = update.value
     else:
         current_value = 0
 
-
-    # Build up a data structure that will bin date strings to the last progress
-    # update for that date.
-    bins = {}
-    for n in range((end_date-start_date).days+1):
-        date = start_date + timedelta(days=n)
-        date_string = "%d/%d/%d" % (date.month, date.day, date.year)
-        bins[date_string] = {"x": n, "date_string": date_string, "y": 0}
-
-    # for each update we store check to see if it's the latest update for
-    # the given date_string bucket and if so we'll use that update
-    for update in updates:
-        date_string = "%d/%d/%d" % (
-            update.created_datetime.month,
-            update.created_datetime.day,
-            update.created_datetime.year,
-        )
-
-        if "date" not in bins[date_string] or update.created_datetime > bins[date_string]["date"]:
-            bins[date_string]["date"] = update.created_datetime
-            bins[date_string]["y"] = update.value
-
-    # remove the datetime object since we don't need it
-    for d in bins.itervalues():
-        if "date" in d:
-            del d["date"]
-
-    # we have them in day bins, now put them into a json list sorted on date
-    sorted_keys = sorted(bins.keys())
-    goal_updates = simplejson.dumps([bins[k] for k in sorted_keys])
+    # use daily buckets unless the goal has been running long enough that
+    # it would produce too many points. The granularity can be forced with
+    # the "granularity" query string parameter. The chart data itself is
+    # loaded from application_series
+    granularity = series.get_granularity(app, request.GET.get("granularity"))
+    bin_label, bin_units = binning.LABELS[granularity]
 
     # get the list of charities supporting by this application
-    supporting_charities = Charity.objects.filter(pk__in=app.charities)
+    supporting_charities = charity_registry.get_charities(app.charities)
 
     # render the template with the context
     return render(request, TEMPLATE_VIEW_APPLICATION, {
         "application": app,
         "supporting_charities": supporting_charities,
-        "goal_updates": goal_updates,
-        "goal_donations": goal_donations,
         "total_donations": total_donations,
         "current_value": current_value,
+        "granularity": granularity,
+        "bin_label": bin_label,
+        "bin_units": bin_units,
+        "static_charts": settings.STATIC_CHARTS and not request.GET.get("interactive"),
+        "application_url": request.build_absolute_uri(
+            reverse(view_application, args=[app.slug])),
+        "badge_url": request.build_absolute_uri(
+            reverse(application_badge, args=[app.slug])),
     })
 
+def application_badge(request, slug=None):
+    """
+    Returns a small SVG badge with the total raised and the progress of the
+    application matching the given slug, for embedding on other sites. The
+    badge is cached with the goal page and may be cached publicly for
+    BADGE_MAX_AGE seconds.
+    """
+    def render_badge():
+        app = get_application_or_404(slug)
+        update = series.get_latest_update(app)
+        current_value = update is not None and update.value or 0
+        progress = min(float(current_value) / app.goal_value, 1.0)
+        return render_to_string(TEMPLATE_BADGE, {
+            "application": app,
+            "total_donations": app.total_donations,
+            "current_value": current_value,
+            "progress_width": int(progress * 230),
+        })
+
+    response = HttpResponse(pagecache.cache_fragment(slug, "badge", render_badge),
+                            mimetype="image/svg+xml")
+    response["Cache-Control"] = "public, max-age=%d" % BADGE_MAX_AGE
+    return response
+
+def _get_series_version(request, slug):
+    """
+    Returns the (application, granularity, points, last modified, etag)
+    tuple of the series requested. It is computed once per request since
+    both the ETag and the Last-Modified callbacks of application_series
+    need it.
+    """
+    if not hasattr(request, "_series_version"):
+        app = get_application_or_404(slug)
+        granularity = series.get_granularity(app, request.GET.get("granularity"))
+        max_points = series.get_max_points(request.GET.get("points"))
+        last_modified = series.get_last_modified(app)
+        etag = series.get_etag(app, granularity, max_points, last_modified)
+        request._series_version = (app, granularity, max_points,
+                                   last_modified, etag)
+    return request._series_version
+
+@condition(etag_func=lambda request, slug: _get_series_version(request, slug)[4],
+           last_modified_func=lambda request, slug: _get_series_version(request, slug)[3])
+def application_series(request, slug=None):
+    """
+    Returns the donation and progress series of the application matching the
+    given slug as JSON. Responses carry an ETag and a Last-Modified header
+    so charts being reloaded get a 304 until a donation or update arrives.
+    The "points" query string parameter lowers the number of points each
+    series is downsampled to.
+    """
+    app, granularity, max_points, last_modified, etag = \
+        _get_series_version(request, slug)
+    response = JSONResponse(series.build_series(app, granularity, max_points))
+    response["Cache-Control"] = "public, max-age=0, must-revalidate"
+    return response
+
+def leaderboard(request):
+    """
+    Shows a page of the top goals snapshot of the metric given by the
+    "sort" query string parameter. The "cursor" parameter selects the page.
+    """
+    metric = request.GET.get("sort")
+    if metric not in leaderboards.METRICS:
+        metric = leaderboards.FUNDED
+
+    try:
+        entries, next_cursor = leaderboards.get_page(metric,
+                                                     request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    return render(request, TEMPLATE_LEADERBOARD, {
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "metric": metric,
+        "metrics": [(m, leaderboards.LABELS[m]) for m in leaderboards.METRICS],
+    })
+
+def rebuild_leaderboard(request):
+    """
+    Cron handler starting a rebuild of the leaderboard snapshots. It's
+    restricted to administrators (and cron) in app.yaml.
+    """
+    leaderboards.start_rebuild()
+    return HttpResponse("OK", mimetype="text/plain")
+
+def sweep_payments(request):
+    """
+    Cron handler scheduling a batch of the pending payment notifications.
+    It's restricted to administrators (and cron) in app.yaml.
+    """
+    payments.sweep_notifications()
+    return HttpResponse("OK", mimetype="text/plain")
+
+@condition(etag_func=lambda request, slug, chart: "%s-%s" % (chart, _get_series_version(request, slug)[4]),
+           last_modified_func=lambda request, slug, chart: _get_series_version(request, slug)[3])
+def application_chart(request, slug=None, chart=None):
+    """
+    Returns the progress or donation chart of the application matching the
+    given slug as a static SVG image. Charts are rendered from the same
+    series as application_series and cached for each version of them.
+    """
+    app, granularity, max_points, last_modified, etag = \
+        _get_series_version(request, slug)
+
+    def render_chart():
+        data = series.build_series(app, granularity, max_points)
+        return svgcharts.render_chart(app, chart, data)
+
+    content = pagecache.cache_fragment(slug, "%s:%s" % (chart, etag), render_chart)
+    response = HttpResponse(content, mimetype="image/svg+xml")
+    response["Cache-Control"] = "public, max-age=0, must-revalidate"
+    return response
+
 @login_required
 def create_edit_application(request, app_id=None):
     """
@@ -423,7 +565,7 @@ def create_edit_application(request, app_id=None):
     """
 
     # begin building up a context to supply to the template
-    base_context = {"charities": Charity.objects.all()}
+    base_context = {"charities": charity_registry.get_all()}
 
     if request.method == "GET":
         # Edit an existing application by building up the context
@@ -567,6 +709,7 @@ def create_edit_application(request, app_id=None):
 
     # Save the application and redirect to the account page
     app.save()
+    pagecache.bump_generation(app.slug)
 
     return redirect(account)
 
@@ -583,11 +726,29 @@ def delete_application(request, app_id=None):
 
         # delete the application
         app.delete()
+        slugs.invalidate(app.slug)
+        pagecache.bump_generation(app.slug)
         messages.info(request, "Application deleted!")
 
     # redirect to the account page
     return redirect(account)
 
+@login_required
+def export_donations(request, app_id=None, format=None):
+    """
+    Returns the completed donations of one of the user's applications as a
+    CSV or JSON download. The runtime buffers the generated body, so an
+    export is limited by the request deadline and response size limit (see
+    donate.export).
+    """
+    app = get_object_or_404(Application, pk=int(app_id), user=request.user)
+
+    response = HttpResponse(export.FORMATTERS[format](app),
+                            mimetype=export.CONTENT_TYPES[format])
+    response["Content-Disposition"] = \
+        "attachment; filename=%s-donations.%s" % (app.slug, format)
+    return response
+
 ##
 # Non view methods
 ##
@@ -656,6 +817,7 @@ def bootstrap(request):
 
     # clear and create applications
     Application.objects.all().delete()
+    slugs.invalidate("help-john-lose-weight")
 
     goal_value = 20
     a = Application(user=u,
@@ -678,28 +840,36 @@ def bootstrap(request):
 
     # clear and create donations
     Donation.objects.all().delete()
+    DailyDonationTotal.objects.all().delete()
 
     # Uncomment the following to create some random donations over the period 
     # of the application
     for i in range(25):
         random_datetime = create_random_datetime(a.created_datetime, now)
-        d = Donation(application=a, amount=randrange(1, 12))
+        d = Donation(pay_key="BOOTSTRAP-%d" % i,
+                     application=a,
+                     application_slug=a.slug,
+                     amount=randrange(1, 12))
         d.created_datetime = random_datetime
         d.save()
 
     # clear and create some updates
     ProgressUpdate.objects.all().delete()
+    DailyProgress.objects.all().delete()
 
     # Uncomment the following to create some updates over the period 
     # of the application
     i = 1
     for n in range((now - a.created_datetime).days+1):
         dt = a.created_datetime + timedelta(days=n)
-        u = ProgressUpdate(application=a, value=i)
-        u.created_datetime = dt
-        u.save()
+        daily_progress.record_progress(a, i, now=dt)
 
         i += 2
 
+    # the donations above were written directly so build the rollups
+    # the goal page reads from
+    rollups.rebuild_application(a)
+    pagecache.bump_generation(a.slug)
+
     messages.success(request, "Database bootstrap complete...")
     return redirect(view_application, slug=a.slug)
@@ -0,0 +1,60 @@
+"""
+Warmup steps priming a new instance, so the first requests it serves
+don't pay for loading caches. They are run by djangoappengine's warmup
+view, see WARMUP_STEPS in settings.py.
+"""
+from django.core.urlresolvers import get_resolver, reverse
+from django.template.loader import get_template
+import assets
+import charity_registry
+import leaderboard
+import slugs
+
+# Templates rendered by the most visited pages. With the cached template
+# loader, loading them once keeps them compiled for the instance's lifetime
+HOT_TEMPLATES = (
+    "base_template.html",
+    "index.html",
+    "view_application.html",
+    "protovis_goal_chart.html",
+    "protovis_donation_chart.html",
+    "confirm_donation.html",
+    "leaderboard.html",
+    "badge.svg",
+    "svg_chart.svg",
+)
+
+# The number of top goals whose slugs are resolved ahead of time
+HOT_GOALS = 20
+
+def load_charity_registry():
+    charity_registry.load()
+
+def compile_templates():
+    for name in HOT_TEMPLATES:
+        get_template(name)
+
+def build_url_resolver():
+    """
+    Builds the URL resolver and its reverse lookup tables, which are
+    otherwise built by the first request calling reverse()
+    """
+    get_resolver(None)
+    reverse("donate.views.index")
+
+def load_static_manifest():
+    assets.get_manifest()
+
+def touch_hot_keys():
+    """
+    Reads the leaderboard snapshots, reloading any that were evicted from
+    memcache, and resolves the slugs of the top goals into the local slug
+    cache.
+    """
+    top = []
+    for metric in leaderboard.METRICS:
+        top.extend(leaderboard.get_snapshot(metric)[:HOT_GOALS])
+
+    hot_slugs = set([entry["slug"] for entry in top])
+    for slug in hot_slugs:
+        slugs.resolve(slug)
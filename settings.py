@@ -25,16 +25,57 @@ INSTALLED_APPS = (
 TEST_RUNNER = 'djangotoolbox.test.CapturingTestSuiteRunner'
 
 ADMIN_MEDIA_PREFIX = '/media/admin/'
-"""
-STATICFILES_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+##
+# Static files. "manage.py build_static" builds the files of STATICFILES_DIRS
+# into STATICFILES_ROOT under content-hashed names, which app.yaml serves
+# at STATICFILES_URL, and records the names in STATIC_MANIFEST for the
+# static_assets template tags.
+##
 STATICFILES_DIRS = (
     os.path.join(os.path.dirname(__file__), 'static'),
 )
+STATICFILES_ROOT = os.path.join(os.path.dirname(__file__), '_static')
 STATICFILES_URL = '/static/'
-MEDIA_URL = '/static/'
-"""
+STATICFILES_FINDERS = (
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+)
+STATIC_MANIFEST = os.path.join(os.path.dirname(__file__), 'staticfiles.json')
+
+##
+# Files concatenated and minified into a single asset by build_static
+##
+STATIC_BUNDLES = {
+    'css/site.css': ('css/blueprint/screen.css', 'css/style.css'),
+    'js/site.js': ('js/jquery-1.4.4.js',),
+    'js/charts.js': ('js/protovis-r3.2.js',),
+}
 TEMPLATE_DIRS = (os.path.join(os.path.dirname(__file__), 'templates'),)
 
+##
+# Keep compiled templates around for the lifetime of the instance, except
+# on the development server where templates are edited
+##
+TEMPLATE_LOADERS = (
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+)
+if not DEBUG:
+    TEMPLATE_LOADERS = (
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    )
+
+##
+# Steps run by warmup requests to prime a new instance (see donate.warmup)
+##
+WARMUP_STEPS = (
+    'donate.warmup.load_charity_registry',
+    'donate.warmup.compile_templates',
+    'donate.warmup.build_url_resolver',
+    'donate.warmup.load_static_manifest',
+    'donate.warmup.touch_hot_keys',
+)
+
 ROOT_URLCONF = 'urls'
 
 SITE_ID = 1
@@ -48,6 +89,14 @@ try:
 except ImportError:
     pass
 
+##
+# Serve entities fetched by primary key from a request-local and a
+# memcache cache (see djangoappengine.db.entitycache). All the writes go
+# through the ORM, so the backend keeps the cache up to date.
+##
+GAE_ENTITY_CACHE = True
+GAE_ENTITY_CACHE_TIMEOUT = 60 * 10
+
 # NOTE: The emails below are test accounts to simulate a donation to a
 # non-profit like the Red Cross. Ideally you would have a UI to help adding 
 # new charities or provide a way for users creating applications to supply
@@ -77,6 +126,12 @@ CHARITIES = [
 ##
 API_ENDPOINT = "https://svcs.sandbox.paypal.com/AdaptivePayments"
 
+##
+# The number of seconds we wait for PayPal to answer an API request before
+# giving up. App Engine allows at most 10 seconds for user-facing requests.
+##
+PAYPAL_DEADLINE = 10
+
 ##
 # Your API username
 ##
@@ -115,3 +170,29 @@ PAYPAL_RESPONSE_DATA_FORMAT = "JSON"
 RETURN_URL = "http://localhost:8081/finish_donation?payKey=${payKey}"
 CANCEL_URL = "http://localhost:8081/cancel_donation?payKey=${payKey}"
 
+##
+# URL PayPal posts Instant Payment Notifications (IPN) to when the status
+# of a payment changes. It must be publicly reachable for PayPal to use it.
+##
+IPN_URL = "http://localhost:8081/paypal_ipn"
+
+
+##
+# Keep every progress update in the ProgressUpdate kind as an audit history.
+# The goal pages only read the per-day DailyProgress rows, so this is off by
+# default to avoid one extra write per update.
+##
+PROGRESS_HISTORY = False
+
+##
+# The maximum number of points in each series of the goal charts. Longer
+# series are downsampled on the server before they are sent to the browser.
+##
+CHART_MAX_POINTS = 60
+
+##
+# Show the goal charts as static SVG images rendered on the server. The
+# Protovis charts are then only loaded when a visitor asks for the
+# interactive charts (?interactive=1).
+##
+STATIC_CHARTS = True
@@ -6,7 +6,9 @@ handler500 = 'djangotoolbox.errorviews.server_error'
 urlpatterns = patterns('',
     ('^_ah/warmup$', 'djangoappengine.views.warmup'),
 
-    # Serving static files from the static directory
+    # Serving static files from the static directory. app.yaml normally
+    # serves them (the sources until "manage.py build_static" points it at
+    # the hashed files), so this is only a fallback without that handler
     (r'^static/(?P<path>.*)$', 'django.views.static.serve', {
         'document_root': os.path.join(os.path.abspath(os.path.dirname(__file__)), "static")
     }),
@@ -14,17 +16,25 @@ urlpatterns = patterns('',
 
 urlpatterns += patterns('donate.views',
     ('^$', 'index'),
+    (r'^goal/(?P<slug>[^/]+)/series.json$', 'application_series'),
+    (r'^goal/(?P<slug>[^/]+)/badge.svg$', 'application_badge'),
+    (r'^goal/(?P<slug>[^/]+)/(?P<chart>progress|donations).svg$', 'application_chart'),
     (r'register$', 'register'),
     (r'account$', 'account'),
     (r'donate', 'donate'),
     (r'cancel_donation', 'cancel_donation'),
     (r'finish_donation', 'finish_donation'),
+    (r'^paypal_ipn$', 'paypal_ipn'),
+    (r'^payments/sweep$', 'sweep_payments'),
+    (r'^leaderboard$', 'leaderboard'),
+    (r'^leaderboard/rebuild$', 'rebuild_leaderboard'),
     (r'update_progress', 'update_progress'),
     (r'goal/(?P<slug>.*)$', 'view_application'),
     (r'application$', 'create_edit_application'),
     (r'application/(?P<app_id>\d+)$', 'create_edit_application'),
 
     (r'applications/(?P<app_id>\d+)/delete$', 'delete_application'),
+    (r'applications/(?P<app_id>\d+)/donations\.(?P<format>csv|json)$', 'export_donations'),
     (r'signin$', 'signin'),
     (r'signout$', 'signout'),
 